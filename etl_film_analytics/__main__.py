@@ -0,0 +1,57 @@
+"""Command line interface of the etl, e.g.
+
+    python -m etl_film_analytics build-index --text_filepath=..
+    python -m etl_film_analytics etl --metadata_filepath=..
+
+Each subcommand is a script with its own options,
+the script is imported only when its subcommand is run.
+"""
+import sys
+import argparse
+import importlib
+
+# subcommand -> script, with `parse_input(args)` and `run(args)`
+COMMANDS = {
+    "build-index": "etl_film_analytics.scripts.create_hash_table",
+    "etl": "etl_film_analytics.scripts.etl",
+    "create-tables": "etl_film_analytics.scripts.create_tables",
+    "create-seekable-gzip": "etl_film_analytics.scripts.create_seekable_gzip",
+    "bench": "etl_film_analytics.benchmarks.run_benchmarks",
+}
+
+
+def parse_input(args):
+    parser = argparse.ArgumentParser(
+        prog="python -m etl_film_analytics",
+        description="ETL pipeline of the film analytics. "
+                    "Run '<command> --help' for the options of a command")
+    parser.add_argument(
+        "command",
+        help="Command to run",
+        choices=list(COMMANDS)
+    )
+    parser.add_argument(
+        "args",
+        help="Options of the command",
+        nargs=argparse.REMAINDER
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_input(args)
+    script = importlib.import_module(COMMANDS[args.command])
+    # the usage of the script shows the subcommand
+    sys.argv[0] = f"python -m etl_film_analytics {args.command}"
+    script_args = script.parse_input(args.args)
+    if getattr(script_args, "profile", None):
+        from etl_film_analytics.src.metrics import run_with_profile
+        run_with_profile(script.run, script_args.profile, script_args)
+    else:
+        script.run(script_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from tabulate import tabulate
+
+from etl_film_analytics.src.processing_csv import process_metadata
+from etl_film_analytics.benchmarks.synthetic_data import write_metadata_csv
+
+
+def time_process_metadata(path_metadata, number_of_elements, engine):
+    """Elapsed time of `process_metadata`, in seconds"""
+    start = time.time()
+    process_metadata(path_metadata, number_of_elements, engine=engine)
+    return time.time() - start
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for number_of_rows in args.sizes:
+            path_metadata = os.path.join(directory, f"{number_of_rows}.csv")
+            print(f"Generating {number_of_rows} films..")
+            write_metadata_csv(path_metadata, number_of_rows)
+            for engine in args.engines:
+                for number_of_elements in [args.number_of_elements, None]:
+                    elapsed_time = time_process_metadata(
+                        path_metadata, number_of_elements, engine)
+                    results.append([
+                        number_of_rows,
+                        engine,
+                        number_of_elements or "all",
+                        round(elapsed_time, 3)
+                    ])
+            os.remove(path_metadata)
+    print(tabulate(
+        results,
+        headers=["rows", "engine", "selected", "time [s]"],
+        tablefmt="psql"
+    ))
+
+
+def parse_input(args):
+    parser = argparse.ArgumentParser(
+        description="Measure how the processing of film metadata scales")
+    parser.add_argument(
+        "--sizes",
+        help="Number of films of each synthetic dataset",
+        nargs="+", default=[45000, 500000, 5000000], type=int
+    )
+    parser.add_argument(
+        "--engines",
+        help="Engines of `process_metadata` to measure",
+        nargs="+", default=["csv", "arrow"], choices=["csv", "arrow"]
+    )
+    parser.add_argument(
+        "--number_of_elements",
+        help="Number of films selected in the top-K runs",
+        default=1000, type=int
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_input(args)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
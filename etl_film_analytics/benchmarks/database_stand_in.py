@@ -0,0 +1,47 @@
+class StandInCursor:
+    """Cursor that accepts the statements of the loader and discards them.
+    The rows sent with COPY are read to the end, so the cost of encoding
+    them on the client is measured.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, vars=None):
+        self.connection.statements += 1
+
+    def copy_expert(self, sql, file, size=8192):
+        self.connection.statements += 1
+        while True:
+            block = file.read(size)
+            if not block:
+                break
+            self.connection.bytes_sent += len(block)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class StandInConnection:
+    """Local stand-in of a psycopg2 connection,
+    to benchmark the database insert path without a Postgres server
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.bytes_sent = 0
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import datetime
+import statistics
+import subprocess
+
+import psycopg2
+from tabulate import tabulate
+
+from etl_film_analytics.src.constants import PROJECT_PATH
+from etl_film_analytics.src import utils_tables, processing_csv
+from etl_film_analytics.src.search_by_hash import search_documents_by_hash, \
+    load_table
+from etl_film_analytics.src.title_index import build_title_index, \
+    save_title_index
+from etl_film_analytics.benchmarks.synthetic_data import write_metadata_csv, \
+    write_wikipedia_xml, film_title, film_year
+from etl_film_analytics.benchmarks.database_stand_in import StandInConnection
+
+
+class Fixture:
+    """Synthetic datasets of a given size, generated once
+    and reused by the following runs with the same size and seed
+    """
+
+    def __init__(self, directory, number_of_documents, number_of_films, seed):
+        self.number_of_documents = number_of_documents
+        self.number_of_films = number_of_films
+        name = f"{number_of_documents}_{number_of_films}_{seed}"
+        self.metadata_filepath = os.path.join(
+            directory, f"metadata_{name}.csv")
+        self.wikipedia_filepath = os.path.join(
+            directory, f"wikipedia_{name}.xml")
+        self.table_filepath = os.path.join(directory, f"wikipedia_{name}.idx")
+        if not os.path.exists(self.metadata_filepath):
+            print(f"Generating {number_of_films} films..")
+            write_metadata_csv(self.metadata_filepath, number_of_films, seed)
+        if not os.path.exists(self.wikipedia_filepath):
+            print(f"Generating {number_of_documents} wikipedia documents..")
+            write_wikipedia_xml(self.wikipedia_filepath, number_of_documents,
+                                number_of_films, seed)
+        if not os.path.exists(self.table_filepath):
+            save_title_index(
+                build_title_index(self.wikipedia_filepath, os.cpu_count()),
+                self.table_filepath)
+
+
+def bench_create_hash_table(fixture, args):
+    table_filepath = fixture.table_filepath + ".bench"
+
+    def create_hash_table(workers):
+        index = build_title_index(fixture.wikipedia_filepath, workers)
+        save_title_index(index, table_filepath)
+        return fixture.number_of_documents
+
+    for workers in sorted({1, args.workers}):
+        yield {"workers": workers}, lambda: create_hash_table(workers), None
+    os.remove(table_filepath)
+
+
+def bench_load_index(fixture, args):
+    def load_index(warm):
+        index = load_table(fixture.table_filepath)
+        if warm:
+            # touch every page of the memory mapped arrays
+            int(index.keys.sum()), int(index.offsets.sum())
+        return len(index)
+
+    for warm in [False, True]:
+        yield {"warm": warm}, lambda: load_index(warm), None
+
+
+def bench_get_documents_features(fixture, args):
+    rng = random.Random(args.seed)
+    film_ids = [rng.randint(1, fixture.number_of_films)
+                for _ in range(args.queries)]
+    documents = [(film_title(film_id), film_year(film_id))
+                 for film_id in film_ids]
+    table = load_table(fixture.table_filepath)
+
+    def get_documents_features(sort_by_position, workers):
+        search_documents_by_hash(
+            fixture.wikipedia_filepath, documents, table,
+            sort_by_position=sort_by_position, workers=workers)
+        return len(documents)
+
+    for sort_by_position in [False, True]:
+        for workers in sorted({1, args.workers}):
+            yield (
+                {"sort_by_position": sort_by_position, "workers": workers},
+                lambda: get_documents_features(sort_by_position, workers),
+                None
+            )
+
+
+def bench_process_metadata(fixture, args):
+    def process_metadata(engine, number_of_elements):
+        processing_csv.process_metadata(
+            fixture.metadata_filepath, number_of_elements, engine=engine)
+        return fixture.number_of_films
+
+    for engine in ["csv", "arrow"]:
+        for number_of_elements in [args.number_of_elements, None]:
+            yield (
+                {"engine": engine, "selected": number_of_elements or "all"},
+                lambda: process_metadata(engine, number_of_elements),
+                None
+            )
+
+
+def bench_database_insert(fixture, args):
+    df = processing_csv.process_metadata(fixture.metadata_filepath)
+    df["content_hash"] = utils_tables.compute_content_hash(df)
+    df["wikipedia_page_link"] = None
+    df["wikipedia_abstract"] = None
+    if args.database_uri:
+        conn = psycopg2.connect(args.database_uri)
+        utils_tables.reset_tables(conn)
+    else:
+        conn = StandInConnection()
+
+    def load_films():
+        utils_tables.load_films(conn, df, batch_size=args.batch_size)
+        utils_tables.load_film_companies(conn, df, batch_size=args.batch_size)
+        return len(df)
+
+    database = "postgres" if args.database_uri else "stand-in"
+    # the loaded rows are discarded after each repetition
+    yield {"database": database}, load_films, conn.rollback
+    conn.close()
+
+
+SCENARIOS = {
+    "create_hash_table": bench_create_hash_table,
+    "load_index": bench_load_index,
+    "get_documents_features": bench_get_documents_features,
+    "process_metadata": bench_process_metadata,
+    "database_insert": bench_database_insert,
+}
+
+
+def measure(function, teardown, repeat):
+    """Run a function several times
+
+    Returns:
+        tuple=[int,list]: rows processed by the function,
+            elapsed time of each run in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = function()
+        times.append(time.perf_counter() - start)
+        if teardown is not None:
+            teardown()
+    return rows, times
+
+
+def get_commit():
+    """Commit of the code under measure, None outside a git repository"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=PROJECT_PATH,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenarios(args, directory):
+    results = []
+    for number_of_documents in args.sizes:
+        number_of_films = args.number_of_films or number_of_documents // 2
+        fixture = Fixture(directory, number_of_documents, number_of_films,
+                          args.seed)
+        for scenario in args.scenarios:
+            print(f"Running {scenario} on {number_of_documents} documents..")
+            for variant, function, teardown in SCENARIOS[scenario](
+                    fixture, args):
+                rows, times = measure(function, teardown, args.repeat)
+                best = min(times)
+                results.append({
+                    "scenario": scenario,
+                    "documents": number_of_documents,
+                    "films": number_of_films,
+                    "variant": variant,
+                    "rows": rows,
+                    "times": times,
+                    "best": best,
+                    "median": statistics.median(times),
+                    "rows_per_second": rows / best if best else None
+                })
+    return results
+
+
+def run(args):
+    os.makedirs(args.fixtures_dir, exist_ok=True)
+    results = run_scenarios(args, args.fixtures_dir)
+    print(tabulate(
+        [[result["scenario"], result["documents"],
+          ", ".join(f"{key}={value}"
+                    for key, value in result["variant"].items()),
+          result["rows"], round(result["best"], 4),
+          round(result["rows_per_second"] or 0)]
+         for result in results],
+        headers=["scenario", "documents", "variant", "rows", "best [s]",
+                 "rows/s"],
+        tablefmt="psql"
+    ))
+    if args.output:
+        report = {
+            "commit": get_commit(),
+            "created": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "arguments": {key: value for key, value in vars(args).items()
+                          if key != "database_uri"},
+            "results": results
+        }
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Results stored in {args.output}")
+
+
+def parse_input(args):
+    parser = argparse.ArgumentParser(
+        description="Measure the stages of the ETL on synthetic datasets")
+    parser.add_argument(
+        "--sizes",
+        help="Number of wikipedia documents of each synthetic dataset",
+        nargs="+", default=[10000, 100000, 1000000], type=int
+    )
+    parser.add_argument(
+        "--number_of_films",
+        help="Number of films of the metadata, "
+             "default: half the number of documents",
+        default=None, type=int
+    )
+    parser.add_argument(
+        "--scenarios",
+        help="Scenarios to measure",
+        nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS)
+    )
+    parser.add_argument(
+        "--fixtures_dir",
+        help="Directory of the synthetic datasets, "
+             "they are generated only if missing",
+        default=os.path.join(PROJECT_PATH, "benchmarks", "fixtures")
+    )
+    parser.add_argument(
+        "--output",
+        help="Path of a json file with the results, default: no file",
+        default=None
+    )
+    parser.add_argument(
+        "--repeat",
+        help="Number of runs of each measure, the best one is reported",
+        default=3, type=int
+    )
+    parser.add_argument(
+        "--seed",
+        help="Seed of the synthetic datasets and of the queries",
+        default=0, type=int
+    )
+    parser.add_argument(
+        "--queries",
+        help="Number of films searched in the wikipedia dataset",
+        default=1000, type=int
+    )
+    parser.add_argument(
+        "--number_of_elements",
+        help="Number of films selected in the top-K runs",
+        default=1000, type=int
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of workers of the parallel variants",
+        default=os.cpu_count(), type=int
+    )
+    parser.add_argument(
+        "--batch_size",
+        help="Number of rows sent to the database at once",
+        default=utils_tables.BATCH_SIZE, type=int
+    )
+    parser.add_argument(
+        "--database_uri",
+        help="Postgres database of the insert scenario, its films table "
+             "is reset. Default: a local stand-in that discards the rows",
+        default=None
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_input(args)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import csv
+import random
+
+from etl_film_analytics.src.processing_csv import METADATA_COLUMN_NAMES
+
+
+# shuffles the films in the wikipedia dataset, see `film_at`
+FILM_PERMUTATION_STEP = 1000003
+
+
+def film_year(film_id):
+    """Release year of a synthetic film,
+    shared by the metadata and the wikipedia dataset
+    """
+    return 1920 + film_id * 7 % 98
+
+
+def film_title(film_id):
+    """Title of a synthetic film"""
+    return f"Film {film_id}"
+
+
+def generate_metadata_row(film_id, rng):
+    """Generate a row with the format of the film metadata"""
+    company_ids = rng.sample(range(1, 5000), rng.randint(0, 3))
+    companies = [{"name": f"Company {i}", "id": i} for i in company_ids]
+    year = film_year(film_id)
+    values = {
+        "adult": "False",
+        "belongs_to_collection": "",
+        "budget": rng.choice([0, rng.randint(1, 300) * 100000]),
+        "genres": "[{'id': 18, 'name': 'Drama'}]",
+        "homepage": "",
+        "id": film_id,
+        "imdb_id": f"tt{film_id:07d}",
+        "original_language": "en",
+        "original_title": film_title(film_id),
+        "overview": "A synthetic film, with a comma in its overview.",
+        "popularity": f"{rng.random() * 20:.6f}",
+        "poster_path": f"/{film_id}.jpg",
+        "production_companies": str(companies),
+        "production_countries":
+            "[{'iso_3166_1': 'US', 'name': 'United States of America'}]",
+        "release_date": f"{year}-{rng.randint(1, 12):02d}-01",
+        "revenue": rng.choice([0, rng.randint(1, 10 ** 9)]),
+        "runtime": "100.0",
+        "spoken_languages": "[{'iso_639_1': 'en', 'name': 'English'}]",
+        "status": "Released",
+        "tagline": "",
+        "title": film_title(film_id),
+        "video": "False",
+        "vote_average": f"{rng.randint(0, 100) / 10}",
+        "vote_count": rng.randint(0, 10000),
+    }
+    return [values[column] for column in METADATA_COLUMN_NAMES]
+
+
+def write_metadata_csv(filepath, number_of_rows, seed=0):
+    """Write a csv file with the format of the film metadata
+    Note: as in the original dataset, a few rows are malformed
+        and a few film identifiers are duplicated
+
+    Args:
+        filepath(str): destination path
+        number_of_rows(int): number of films
+        seed(int): seed of the random generator
+    """
+    rng = random.Random(seed)
+    with open(filepath, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(METADATA_COLUMN_NAMES)
+        for i in range(number_of_rows):
+            row = generate_metadata_row(i + 1, rng)
+            if i % 10000 == 9999:
+                # malformed row, with missing fields
+                row = row[:10]
+            elif i % 1000 == 999:
+                # duplicated film
+                row = generate_metadata_row(i, rng)
+            writer.writerow(row)
+
+
+def generate_wikipedia_document(title, rng):
+    """Generate a document with the format of the wikipedia abstract dump
+
+    Returns:
+        str
+    """
+    page = title.replace(" ", "_")
+    sections = rng.sample(
+        ["History", "Plot", "Cast", "Production", "Release", "Reception",
+         "Legacy", "References", "External links"], rng.randint(1, 6))
+    sublinks = "".join(
+        f'<sublink linktype="nav"><anchor>{section}</anchor>'
+        f'<link>https://en.wikipedia.org/wiki/{page}#{section}</link>'
+        f'</sublink>\n'
+        for section in sections)
+    return (
+        f"<doc>\n"
+        f"<title>Wikipedia: {title}</title>\n"
+        f"<url>https://en.wikipedia.org/wiki/{page}</url>\n"
+        f"<abstract>{title} is a synthetic article &amp; a benchmark "
+        f"fixture, {rng.randint(0, 10 ** 6)} words long.</abstract>\n"
+        f"<links>\n{sublinks}</links>\n"
+        f"</doc>\n"
+    )
+
+
+def film_at(position, number_of_films):
+    """Film identifier of the n-th film document of the wikipedia dataset.
+    A fixed permutation spreads the films over the dataset
+    without storing their order.
+    """
+    step = FILM_PERMUTATION_STEP
+    while number_of_films % step == 0:
+        step += 2
+    return position * step % number_of_films + 1
+
+
+def write_wikipedia_xml(filepath, number_of_documents, number_of_films,
+                        seed=0):
+    """Write a file with the format of the wikipedia abstract dump
+    Note: up to half of the documents are films, with the title patterns
+        searched by `search_by_hash.generate_queries`:
+        'Title (year film)', 'Title (film)', 'Title'.
+        One film out of 4 has no document, a few titles are duplicated.
+
+    Args:
+        filepath(str): destination path
+        number_of_documents(int): number of documents
+        number_of_films(int): number of films of the metadata
+        seed(int): seed of the random generator
+    """
+    rng = random.Random(seed)
+    film_position = 0
+    with open(filepath, 'w', encoding="utf-8") as file:
+        file.write("<feed>\n")
+        for i in range(number_of_documents):
+            title = f"Article {i}"
+            if i % 2 == 0 and film_position < number_of_films:
+                film_id = film_at(film_position, number_of_films)
+                film_position += 1
+                pattern = film_id % 4
+                if pattern == 0:
+                    title = f"{film_title(film_id)} ({film_year(film_id)} film)"
+                elif pattern == 1:
+                    title = f"{film_title(film_id)} (film)"
+                elif pattern == 2:
+                    title = film_title(film_id)
+            elif i % 1000 == 999:
+                # duplicated title
+                title = f"Article {i - 1}"
+            file.write(generate_wikipedia_document(title, rng))
+        file.write("</feed>\n")
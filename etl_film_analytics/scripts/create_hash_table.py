@@ -5,22 +5,91 @@ import pickle
 import argparse
 
 from etl_film_analytics.src.constants import DIR_DATA
-from etl_film_analytics.src.search_by_hash import create_hash_table
+from etl_film_analytics.src.gzip_dump import is_gzip_file
+from etl_film_analytics.src.metrics import Metrics, run_with_profile
 
 
 def run(args):
+    # numpy is loaded only to create the table
+    from etl_film_analytics.src.search_by_hash import create_hash_table
+    from etl_film_analytics.src.title_index import save_title_index
+    from etl_film_analytics.src.sharded_index import save_sharded_title_index
+    from etl_film_analytics.src.dump_fingerprint import dump_fingerprint
     print("Creating an Hash table..\n"
           "This could take several minutes..")
     start = time.time()
-    text_file = open(args.text_filepath, 'r')
-    table = create_hash_table(text_file)
-    text_file.close()
+    metrics = Metrics()
+    source = dump_fingerprint(args.text_filepath)
+    segments = None
+    with metrics.stage("build_index") as stage:
+        if args.index_format == "dict":
+            if is_gzip_file(args.text_filepath):
+                raise ValueError(
+                    "The dict format does not support gzip files")
+            if args.shards > 1 or args.update:
+                raise ValueError(
+                    "The dict format does not support sharding and updates")
+            text_file = open(args.text_filepath, 'r')
+            table = create_hash_table(text_file)
+            text_file.close()
+        else:
+            table, segments = build_title_table(args)
+        stage["rows"] += len(table)
     print(f"Elapsed time: {time.time() - start:.2} s")
     print("Storing the Hash table on disk..")
-    table_file = open(args.table_filepath, 'wb')
-    pickle.dump(table, table_file, protocol=pickle.HIGHEST_PROTOCOL)
-    table_file.close()
+    with metrics.stage("save_index") as stage:
+        if args.index_format == "dict":
+            table_file = open(args.table_filepath, 'wb')
+            pickle.dump(table, table_file, protocol=pickle.HIGHEST_PROTOCOL)
+            table_file.close()
+        elif args.shards > 1:
+            save_sharded_title_index(table, args.table_filepath, args.shards,
+                                     source=source, segments=segments)
+        else:
+            save_title_index(table, args.table_filepath,
+                             source=source, segments=segments)
+        stage["rows"] += len(table)
     print(f"Hash table stored in {args.table_filepath}")
+    if args.metrics_out:
+        metrics.save(args.metrics_out)
+        print(f"Metrics stored in {args.metrics_out}")
+
+
+def build_title_table(args):
+    """Create the title index of a wikipedia dataset,
+    or update the current one if requested
+
+    Returns:
+        tuple=[TitleIndex,tuple]: index and segments of the dataset,
+            segments are None for gzip datasets and if not requested
+    """
+    from etl_film_analytics.src.title_index import build_title_index
+    from etl_film_analytics.src.incremental_index import find_segments, \
+        update_title_index, load_index_for_update
+    if is_gzip_file(args.text_filepath):
+        if args.update:
+            print("Warning: gzip datasets cannot be updated, "
+                  "the table is created again")
+        table = build_title_index(
+            args.text_filepath, workers=args.workers, fuzzy=args.fuzzy_index)
+        return table, None
+    if args.update and os.path.exists(args.table_filepath):
+        previous_table, previous_segments = load_index_for_update(
+            args.table_filepath)
+        if previous_segments is not None:
+            table, segments, reused = update_title_index(
+                args.text_filepath, previous_table, previous_segments,
+                workers=args.workers, fuzzy=args.fuzzy_index)
+            print(f"Reused {reused} of {len(segments[0])} segments, "
+                  f"the others have been indexed again")
+            return table, segments
+        print("Warning: the current table does not record the segments "
+              "of its dataset, the table is created again")
+    table = build_title_index(
+        args.text_filepath, workers=args.workers, fuzzy=args.fuzzy_index)
+    if not (args.segments or args.update):
+        return table, None
+    return table, find_segments(args.text_filepath, workers=args.workers)
 
 
 def parse_input(args):
@@ -28,13 +97,73 @@ def parse_input(args):
         description="Create an hash table from a text file")
     parser.add_argument(
         "--text_filepath",
-        help="Path where is stored a text file",
+        help="Path where is stored a text file, "
+             "gzip files are recognised by the '.gz' extension",
         default=os.path.join(DIR_DATA, "test_set_wikipedia.xml")
     )
     parser.add_argument(
         "--table_filepath",
         help="Path where will be stored the hash table",
-        default=os.path.join(DIR_DATA, "test_set_wikipedia_hashed.pickle")
+        default=os.path.join(DIR_DATA, "test_set_wikipedia_hashed.idx")
+    )
+    parser.add_argument(
+        "--index_format",
+        help="title: compact index of the title lines only, "
+             "stored as a memory mappable file, "
+             "dict: dictionary of every line of the file, "
+             "stored as a pickle",
+        choices=["title", "dict"],
+        default="title"
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes used to create the title index",
+        default=os.cpu_count(), type=int
+    )
+    parser.add_argument(
+        "--fuzzy_index",
+        help="Index the normalized titles as well (title format only): "
+             "the films without an exact match are searched "
+             "ignoring case, punctuation, diacritics and qualifiers",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--shards",
+        help="Number of shards of the title index (title format only). "
+             "If larger than 1, the table path is a directory "
+             "with a manifest and a file per shard: "
+             "each lookup maps only the shard of its title",
+        default=1, type=int
+    )
+    parser.add_argument(
+        "--segments",
+        help="Record the segments of the dataset in the table, "
+             "so that the next versions can be indexed with --update "
+             "(title format, uncompressed datasets only). "
+             "It costs an additional pass over the dataset, "
+             "--update always records them",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--update",
+        help="Update the table at --table_filepath for a new version "
+             "of the dataset (title format only): the segments "
+             "of the dataset that did not change reuse their entries, "
+             "only the others are indexed again",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--metrics_out",
+        help="Path of a json report with the time, rows, bytes read "
+             "and memory of each stage, default: no report. "
+             "The reads of the worker processes are not counted",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Path where the cProfile statistics of the run are stored, "
+             "default: no profiling",
+        default=None
     )
     return parser.parse_args(args)
 
@@ -43,7 +172,10 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     args = parse_input(args)
-    run(args)
+    if args.profile:
+        run_with_profile(run, args.profile, args)
+    else:
+        run(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import argparse
+
+from etl_film_analytics.src.constants import DIR_DATA
+from etl_film_analytics.src.gzip_dump import write_seekable_gzip, MEMBER_SIZE
+
+
+def run(args):
+    print("Compressing the file in independent gzip members..\n"
+          "This could take several minutes..")
+    start = time.time()
+    write_seekable_gzip(
+        args.input_filepath,
+        args.output_filepath,
+        member_size=args.member_size
+    )
+    print(f"Elapsed time: {time.time() - start:.2} s")
+    print(f"Seekable gzip file stored in {args.output_filepath}")
+
+
+def parse_input(args):
+    parser = argparse.ArgumentParser(
+        description="Compress a wikipedia dataset as a seekable gzip file")
+    parser.add_argument(
+        "--input_filepath",
+        help="Path where is stored a plain or gzip wikipedia dataset",
+        default=os.path.join(DIR_DATA, "enwiki-latest-abstract.xml.gz")
+    )
+    parser.add_argument(
+        "--output_filepath",
+        help="Path where will be stored the seekable gzip file",
+        default=os.path.join(DIR_DATA, "enwiki-latest-abstract-seekable.xml.gz")
+    )
+    parser.add_argument(
+        "--member_size",
+        help="Uncompressed size of each gzip member, in bytes",
+        default=MEMBER_SIZE, type=int
+    )
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_input(args)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
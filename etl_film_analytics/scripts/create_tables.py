@@ -1,7 +1,7 @@
-import psycopg2
+import sys
+import argparse
 
 from etl_film_analytics.src.constants import DB_URI
-from etl_film_analytics.src import utils_tables, sql_queries
 
 
 def main(
@@ -15,6 +15,8 @@ def main(
         check_content(bool): if True, display tables at the end of execution
         db_uri(str): uri of a database
     """
+    import psycopg2
+    from etl_film_analytics.src import utils_tables, sql_queries
     conn = psycopg2.connect(db_uri)
     utils_tables.reset_tables(conn)
     if check_content:
@@ -22,5 +24,25 @@ def main(
     conn.close()
 
 
+def run(args):
+    main(check_content=not args.skip_check, db_uri=args.database_uri)
+
+
+def parse_input(args):
+    parser = argparse.ArgumentParser(
+        description="Drop and create the tables of the database")
+    parser.add_argument(
+        "--database_uri",
+        help="Uri of the destination database",
+        default=DB_URI
+    )
+    parser.add_argument(
+        "--skip_check",
+        help="Do not display the tables at the end of execution",
+        action="store_true"
+    )
+    return parser.parse_args(args)
+
+
 if __name__ == "__main__":
-    main()
+    run(parse_input(sys.argv[1:]))
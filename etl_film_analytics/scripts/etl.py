@@ -2,50 +2,257 @@ import os
 import sys
 import time
 import argparse
-import psycopg2
 
-from etl_film_analytics.src.constants import DB_URI, DIR_DATA
-from etl_film_analytics.src import sql_queries
-from etl_film_analytics.src import utils_tables, processing_csv
-from etl_film_analytics.src.search_by_hash import get_data_from_wikipedia
+from etl_film_analytics.src.constants import DB_URI, DIR_DATA, BATCH_SIZE, \
+    CHUNK_SIZE
+from etl_film_analytics.src.dump_fingerprint import file_fingerprint
+from etl_film_analytics.src.lookup_cache import LookupCache, \
+    get_data_with_cache
+from etl_film_analytics.src.metrics import Metrics, run_with_profile
+from etl_film_analytics.src.pipeline import iter_in_background
 
 
-def run(args):
-    start = time.time()
-    print(f"Connecting to {args.database_uri}..")
-    conn = psycopg2.connect(args.database_uri)
-    cur = conn.cursor()
+class WikipediaLookup:
+    """Query the wikipedia dataset for chunks of films.
+    The hash table and the cache are opened once and reused by every chunk,
+    the hash table is loaded only when a chunk needs it.
+    """
 
-    print("Processing film metadata..")
-    df_metadata = processing_csv.process_metadata(
-        path_metadata=args.metadata_filepath,
-    )
-    print(f"Processed {len(df_metadata)} films")
+    def __init__(self, args, metrics):
+        self.args = args
+        self.metrics = metrics
+        self.table = None
+        self.cache = None
+        if args.cache_filepath:
+            self.cache = LookupCache(
+                args.cache_filepath, self.cache_fingerprint())
+
+    def cache_fingerprint(self):
+        """Identify the results of the lookups: the version of the dataset
+        and, in index mode, if the table matches normalized titles,
+        so that misses cached without them are not reused
+        """
+        fingerprint = file_fingerprint(self.args.wikipedia_filepath)
+        if self.args.lookup_mode == "index":
+            from etl_film_analytics.src import search_by_hash
+            if search_by_hash.has_fuzzy_index(self.args.table_filepath):
+                fingerprint += ":fuzzy"
+        return fingerprint
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def search(self, documents):
+        # the search modules load numpy, they are imported on demand
+        from etl_film_analytics.src import search_by_hash, search_by_scan
+        if self.args.lookup_mode == "scan":
+            with self.metrics.stage("search_documents") as stage:
+                stage["rows"] += len(documents)
+                return search_by_scan.get_data_from_wikipedia(
+                    file=self.args.wikipedia_filepath,
+                    documents=documents,
+                    stats=self.metrics.lookups
+                )
+        if self.table is None:
+            print(f"Loading hash table from {self.args.table_filepath}..")
+            with self.metrics.stage("load_index") as stage:
+                self.table = search_by_hash.load_table(
+                    self.args.table_filepath, self.args.wikipedia_filepath)
+                stage["rows"] += len(self.table)
+        with self.metrics.stage("search_documents") as stage:
+            stage["rows"] += len(documents)
+            return search_by_hash.get_data_from_table(
+                file=self.args.wikipedia_filepath,
+                documents=documents,
+                table=self.table,
+                lookup_workers=self.args.lookup_workers,
+                stats=self.metrics.lookups
+            )
+
+    def get_data_from_wikipedia(self, df_metadata):
+        """Query the wikipedia dataset for the films of a dataframe
+
+        Returns:
+            tuple=[list,list]: wikipedia links and abstracts
+        """
+        film_data = df_metadata.loc[:, ["title", "release_year"]].values
+        if self.cache is not None:
+            return get_data_with_cache(self.cache, film_data, self.search)
+        return self.search(film_data)
+
+
+def enrich_chunk(df_metadata, lookup, loaded_films):
+    """Enrich a chunk of films with wikipedia data
+
+    Args:
+        df_metadata(pd.DataFrame): chunk of processed film metadata
+        lookup(WikipediaLookup): query engine of the wikipedia dataset
+        loaded_films(dict): films in the database, for incremental loads,
+                            see `utils_tables.get_loaded_films`
+
+    Returns:
+        pd.DataFrame: films to load
+    """
+    import numpy as np
+    from etl_film_analytics.src import utils_tables
+    df_metadata = df_metadata.copy()
+    df_metadata["content_hash"] = utils_tables.compute_content_hash(
+        df_metadata)
+    df_metadata["wikipedia_page_link"] = None
+    df_metadata["wikipedia_abstract"] = None
+    # the films are selected by position, their labels can repeat
+    to_lookup = np.ones(len(df_metadata), dtype=bool)
+    if loaded_films is not None:
+        df_metadata, needs_lookup = utils_tables.select_films_to_refresh(
+            df_metadata, loaded_films)
+        to_lookup = needs_lookup.to_numpy(dtype=bool)
+        print(f"{len(df_metadata)} films are new, changed or incomplete, "
+              f"{to_lookup.sum()} need a wikipedia lookup")
 
     print("Merging metadata with film data from Wikipedia:")
-    film_data = df_metadata.loc[:, ["title", "release_year"]].values
-    wikipedia_links, wikipedia_abstracts = get_data_from_wikipedia(
-        file=args.wikipedia_filepath,
-        documents=film_data,
-        table_filepath=args.table_filepath
-    )
-    df_metadata["wikipedia_page_link"] = wikipedia_links
-    df_metadata["wikipedia_abstract"] = wikipedia_abstracts
+    wikipedia_links, wikipedia_abstracts = lookup.get_data_from_wikipedia(
+        df_metadata[to_lookup])
+    df_metadata.loc[to_lookup, "wikipedia_page_link"] = wikipedia_links
+    df_metadata.loc[to_lookup, "wikipedia_abstract"] = wikipedia_abstracts
     print("Merging completed")
+    return df_metadata
+
+
+def enrich_chunks(chunks, lookup, loaded_films):
+    """Enrich a stream of chunks of films, see `enrich_chunk`.
+    Closing the generator closes the stream, e.g. the background stage
+    that produces it, so a failure stops every stage of the chain.
+
+    Yields:
+        pd.DataFrame: films to load
+    """
+    try:
+        for df_metadata in chunks:
+            yield enrich_chunk(df_metadata, lookup, loaded_films)
+    finally:
+        chunks.close()
+
+
+def load_chunk(conn, df_films, loaded_films, args, metrics):
+    """Load a chunk of enriched films, see `enrich_chunk`
+
+    Args:
+        conn(connection): connection to the database
+        df_films(pd.DataFrame): chunk of enriched films
+        loaded_films(dict): films in the database, for incremental loads
+        args(Namespace): command line arguments
+        metrics(Metrics): measures of the run
+
+    Returns:
+        int: number of films loaded
+    """
+    from etl_film_analytics.src import utils_tables
+    print(f"Loading {len(df_films)} data into the database..")
+    with metrics.stage("load_database") as stage:
+        if loaded_films is not None:
+            utils_tables.upsert_films(
+                conn, df_films, batch_size=args.batch_size)
+        else:
+            utils_tables.load_films(
+                conn, df_films, batch_size=args.batch_size)
+        stage["rows"] += len(df_films)
+    with metrics.stage("load_companies") as stage:
+        utils_tables.load_film_companies(
+            conn, df_films, batch_size=args.batch_size)
+        stage["rows"] += len(df_films)
+    return len(df_films)
+
+
+def run(args):
+    from etl_film_analytics.src import utils_tables, processing_csv
+    start = time.time()
+    metrics = Metrics()
+    if "parquet" in args.sinks and args.incremental:
+        raise ValueError("The parquet sink exports the films of a full run, "
+                         "it does not support --incremental")
+    conn = None
+    if "postgres" in args.sinks:
+        import psycopg2
+        print(f"Connecting to {args.database_uri}..")
+        conn = psycopg2.connect(args.database_uri)
+    loaded_films = None
+    if args.incremental:
+        utils_tables.create_tables(conn)
+        loaded_films = utils_tables.get_loaded_films(conn)
 
-    print("Selecting films to load..")
-    number_of_elements = args.number_of_elements or len(df_metadata)
-    df_metadata = df_metadata.iloc[:number_of_elements, :]
+    # the scan reads the whole wikipedia dataset, once for all the films
+    chunk_size = args.chunk_size
+    if args.lookup_mode == "scan" or not chunk_size:
+        chunk_size = sys.maxsize
 
-    print(f"Loading {len(df_metadata)} data into the database..")
-    for i, row in df_metadata.iterrows():
-        cur.execute(sql_queries.films_table_insert, row.values)
-    conn.commit()
+    print("Processing film metadata..")
+    chunks = metrics.iterate("process_metadata",
+                             processing_csv.iter_processed_metadata(
+                                 path_metadata=args.metadata_filepath,
+                                 number_of_elements=args.number_of_elements,
+                                 chunk_size=chunk_size
+                             ))
+    lookup = WikipediaLookup(args, metrics)
+    if args.pipeline_depth > 0:
+        # each stage runs in its own thread, one chunk ahead of the next
+        # stage: the database loads a chunk while the following ones
+        # are enriched and processed
+        chunks = iter_in_background(
+            chunks, args.pipeline_depth, name="process_metadata")
+    enriched_chunks = enrich_chunks(chunks, lookup, loaded_films)
+    if args.pipeline_depth > 0:
+        enriched_chunks = iter_in_background(
+            enriched_chunks, args.pipeline_depth, name="enrich_chunks")
+    parquet_sink = None
+    if "parquet" in args.sinks:
+        from etl_film_analytics.src.parquet_export import ParquetSink
+        parquet_sink = ParquetSink(args.parquet_dir)
+    number_of_films = 0
+    try:
+        for df_films in enriched_chunks:
+            if conn is not None:
+                load_chunk(conn, df_films, loaded_films, args, metrics)
+            if parquet_sink is not None:
+                with metrics.stage("export_parquet") as stage:
+                    parquet_sink.write(df_films)
+                    stage["rows"] += len(df_films)
+            number_of_films += len(df_films)
+        if parquet_sink is not None:
+            # the files are written before the database commits,
+            # they are published after it
+            with metrics.stage("export_parquet"):
+                parquet_sink.flush()
+        if conn is not None:
+            print("Refreshing the views..")
+            with metrics.stage("refresh_views"):
+                utils_tables.refresh_views(conn)
+            conn.commit()
+        if parquet_sink is not None:
+            parquet_sink.commit()
+    except BaseException:
+        if conn is not None:
+            conn.rollback()
+        if parquet_sink is not None:
+            parquet_sink.abort()
+        raise
+    finally:
+        # stop the background stages before releasing their resources
+        enriched_chunks.close()
+        lookup.close()
+    print(f"Loaded {number_of_films} films")
 
-    print("Displaying the destination table:")
-    utils_tables.check_database_content(["films"], conn)
+    if conn is not None:
+        print("Displaying the destination table:")
+        utils_tables.check_database_content(
+            ["films", "film_companies", "top_films_per_year"], conn)
+    if parquet_sink is not None:
+        print(f"Films exported to {args.parquet_dir}")
 
     print(f"Elapsed time: {time.time() - start:.3} s")
+    if args.metrics_out:
+        metrics.save(args.metrics_out)
+        print(f"Metrics stored in {args.metrics_out}")
 
 
 def parse_input(args):
@@ -69,11 +276,83 @@ def parse_input(args):
         help="URI fo a database",
         default=DB_URI, type=str
     )
+    parser.add_argument(
+        "--sinks",
+        help="Destinations of the enriched films: "
+             "postgres: the films table of --database_uri, "
+             "parquet: a dataset in --parquet_dir "
+             "partitioned by release year",
+        nargs="+", choices=["postgres", "parquet"], default=["postgres"]
+    )
+    parser.add_argument(
+        "--parquet_dir",
+        help="Directory of the parquet dataset, replaced at each run",
+        default=os.path.join(DIR_DATA, "films_parquet")
+    )
     parser.add_argument(
         "--table_filepath",
         help="Path where to load the hash table of the wikipedia dataset",
         default=os.path.join(
-            DIR_DATA, "enwiki-latest-abstract-hashtable.pickle")
+            DIR_DATA, "enwiki-latest-abstract-hashtable.idx")
+    )
+    parser.add_argument(
+        "--lookup_workers",
+        help="Number of threads that query the wikipedia dataset, "
+             "each one with its own file handle",
+        default=1, type=int
+    )
+    parser.add_argument(
+        "--lookup_mode",
+        help="index: query the hash table of the wikipedia dataset, "
+             "scan: read the wikipedia dataset once, without a table",
+        choices=["index", "scan"],
+        default="index"
+    )
+    parser.add_argument(
+        "--batch_size",
+        help="Number of rows sent to the database at once",
+        default=BATCH_SIZE, type=int
+    )
+    parser.add_argument(
+        "--incremental",
+        help="Merge the films into the current table: "
+             "only new or changed films are loaded "
+             "and films with a wikipedia link are not queried again",
+        action="store_true"
+    )
+    parser.add_argument(
+        "--cache_filepath",
+        help="Path of a SQLite file that caches the wikipedia lookups "
+             "across runs, default: no cache",
+        default=None
+    )
+    parser.add_argument(
+        "--chunk_size",
+        help="Number of films processed, enriched and loaded together, "
+             "0 for a single chunk. "
+             "The scan lookup mode always uses a single chunk",
+        default=CHUNK_SIZE, type=int
+    )
+    parser.add_argument(
+        "--pipeline_depth",
+        help="Number of chunks buffered between the stages. "
+             "If positive, metadata processing, wikipedia lookups "
+             "and database loads run in separate threads "
+             "and overlap on consecutive chunks, "
+             "0 runs them one after another",
+        default=0, type=int
+    )
+    parser.add_argument(
+        "--metrics_out",
+        help="Path of a json report with the time, rows, bytes read "
+             "and memory of each stage, default: no report",
+        default=None
+    )
+    parser.add_argument(
+        "--profile",
+        help="Path where the cProfile statistics of the run are stored, "
+             "default: no profiling",
+        default=None
     )
     return parser.parse_args(args)
 
@@ -82,7 +361,10 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     args = parse_input(args)
-    run(args)
+    if args.profile:
+        run_with_profile(run, args.profile, args)
+    else:
+        run(args)
 
 
 if __name__ == "__main__":
@@ -6,12 +6,15 @@ REPOSITORY_PATH = os.path.realpath(__file__)[
 PROJECT_PATH = os.path.join(REPOSITORY_PATH, PROJECT_NAME)
 DIR_DATA = os.path.join(REPOSITORY_PATH, 'data')
 
-print("project_path:{}".format(PROJECT_PATH))
-print("data_path:{}".format(DIR_DATA))
-
 # Database
 DB_NAME = "analytics_db"
 DB_HOST = "localhost"
 DB_USER = "postgres"
 DB_PASSWORD = ""
 DB_URI = f"postgresql://{DB_USER}@{DB_HOST}/{DB_NAME}"
+
+# Loading
+# number of rows sent to the database at once
+BATCH_SIZE = 10000
+# number of films processed, enriched and loaded together
+CHUNK_SIZE = 10000
@@ -0,0 +1,68 @@
+import os
+import hashlib
+
+# number and size of the blocks sampled across a file
+SAMPLED_BLOCKS = 16
+SAMPLED_BLOCK_SIZE = 1 << 16
+
+
+def sampled_positions(file_size):
+    """Positions of the sampled blocks, evenly spaced from the first
+    to the last block of a file
+    """
+    last = max(0, file_size - SAMPLED_BLOCK_SIZE)
+    return sorted({last * i // (SAMPLED_BLOCKS - 1)
+                   for i in range(SAMPLED_BLOCKS)})
+
+
+def file_fingerprint(filepath):
+    """Identify the version of a file from its size
+    and the content of blocks sampled across it.
+    The modification time is not used: copying or downloading
+    a dump again changes it, while the content is the same.
+    It identifies the dump of the lookup cache and of the tables.
+
+    Returns:
+        str
+    """
+    file_size = os.path.getsize(filepath)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(file_size).encode("utf-8"))
+    with open(filepath, 'rb') as file:
+        for position in sampled_positions(file_size):
+            file.seek(position)
+            digest.update(file.read(SAMPLED_BLOCK_SIZE))
+    return digest.hexdigest()
+
+
+def dump_fingerprint(filepath):
+    """Fingerprint of a wikipedia dump recorded by its tables
+
+    Returns:
+        dict: json serializable, size and `file_fingerprint` of the dump
+    """
+    return {
+        "size": os.path.getsize(filepath),
+        "fingerprint": file_fingerprint(filepath)
+    }
+
+
+def check_dump_fingerprint(fingerprint, filepath):
+    """Check that a dump is the version described by a fingerprint
+
+    Args:
+        fingerprint(dict): see `dump_fingerprint`
+        filepath(str): path of the dump
+
+    Raises:
+        ValueError: if the size or a sampled block differ
+    """
+    current = dump_fingerprint(filepath)
+    if current["size"] != fingerprint["size"]:
+        raise ValueError(
+            f"{filepath} has {current['size']} bytes, "
+            f"the table was built from a dump of {fingerprint['size']} bytes")
+    if current["fingerprint"] != fingerprint.get("fingerprint"):
+        raise ValueError(
+            f"The content of {filepath} differs "
+            f"from the dump the table was built from")
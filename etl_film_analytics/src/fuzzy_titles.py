@@ -0,0 +1,96 @@
+import re
+import html
+import unicodedata
+
+# disambiguation of a title, e.g. 'Heat (1995 American film)'
+QUALIFIER_PATTERN = re.compile(r"^(.*?)\s*\(([^()]*)\)\s*$")
+# article moved at the end of a title, e.g. 'Matrix, The'
+TRAILING_ARTICLE_PATTERN = re.compile(r",\s*(the|a|an)\s*$")
+WORD_PATTERN = re.compile(r"[^\W_]+")
+ARTICLES = {"the", "a", "an"}
+# the qualifier of a title mentions one of these words
+FILM_WORDS = {"film", "movie"}
+
+
+def split_qualifier(title):
+    """Split a title in its base and its qualifier
+
+    Returns:
+        tuple=[str,str]: e.g. ('Heat', '1995 film'), the qualifier is ''
+            for titles without it
+    """
+    match = QUALIFIER_PATTERN.match(title)
+    if match is None or not match.group(1):
+        return title, ""
+    return match.group(1), match.group(2)
+
+
+def normalize_title(title):
+    """Canonical form of a title, insensitive to case, punctuation,
+    diacritics, leading articles and qualifier,
+    e.g. 'The Matrix (1999 film)', 'Matrix, The' -> 'matrix'
+
+    Returns:
+        str
+    """
+    title, _ = split_qualifier(title)
+    if not title.isascii():
+        title = unicodedata.normalize("NFKD", title)
+        title = "".join(
+            char for char in title if not unicodedata.combining(char))
+    title = title.lower().replace("&", " and ")
+    title = TRAILING_ARTICLE_PATTERN.sub("", title)
+    words = WORD_PATTERN.findall(title)
+    if len(words) > 1 and words[0] in ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+
+def normalize_title_line(title_line):
+    """Canonical form of a title line of the wikipedia dataset
+
+    Args:
+        title_line(bytes): '<title>Wikipedia: ...</title>' line,
+                           without trailing spaces
+
+    Returns:
+        str
+    """
+    title = title_line[title_line.find(b":") + 1:title_line.rfind(b"<")]
+    return normalize_title(html.unescape(title.decode("utf-8").strip()))
+
+
+def best_score(year):
+    """Highest score of `score_candidate` for a release year"""
+    year = str(year) if year else ""
+    # year in the qualifier and in the abstract, qualifier mentions a film
+    return 4 + 2 + 1 if year.isdigit() else 1
+
+
+def score_candidate(features, year):
+    """Likelihood that a wikipedia document describes a film of a given year
+
+    Args:
+        features(tuple): title, url and abstract of the document
+        year(str or int): release year of the film, None if unknown
+
+    Returns:
+        int: 0 if the document does not describe the film
+    """
+    title, _, abstract = features
+    qualifier = split_qualifier(title)[1].lower()
+    mentions_film = any(word in FILM_WORDS
+                        for word in WORD_PATTERN.findall(qualifier))
+    year = str(year) if year else ""
+    if not year.isdigit():
+        # without a year, only documents about films are accepted
+        return 1 if mentions_film else 0
+    year_pattern = re.compile(rf"\b{year}\b")
+    score = 0
+    if year_pattern.search(qualifier):
+        score += 4
+    if abstract and year_pattern.search(abstract):
+        score += 2
+    if score and mentions_film:
+        score += 1
+    return score
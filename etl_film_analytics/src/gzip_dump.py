@@ -0,0 +1,191 @@
+import io
+import zlib
+import gzip
+import bisect
+
+# zlib window bits of a gzip stream
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+READ_SIZE = 1 << 16
+# uncompressed size of the members of a seekable gzip file
+MEMBER_SIZE = 1 << 20
+# uncompressed size of the largest member of an indexed gzip file:
+# a query decompresses the member of its document from its beginning
+MAX_MEMBER_SIZE = 16 * MEMBER_SIZE
+
+
+def is_gzip_file(filepath):
+    """Check if a dataset is compressed, from its extension"""
+    return str(filepath).endswith(".gz")
+
+
+def iter_gzip_members(file):
+    """Decompress a gzip file and record the beginning of each member
+
+    A gzip file is a sequence of members that can be decompressed
+    independently, the beginning of each member is a seek point (checkpoint).
+
+    Args:
+        file(BufferedReader): gzip file opened in binary mode
+
+    Yields:
+        tuple=[int,int,bytes]: position of the current member
+            in the compressed file, position of the decompressed block
+            in the uncompressed stream, decompressed block
+    """
+    compressed_position = file.tell()
+    uncompressed_position = 0
+    member_start = compressed_position
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    data = file.read(READ_SIZE)
+    while data:
+        block = decompressor.decompress(data)
+        if block:
+            yield member_start, uncompressed_position, block
+            uncompressed_position += len(block)
+        if decompressor.eof:
+            # a new member starts after the unused data
+            unused_data = decompressor.unused_data
+            compressed_position += len(data) - len(unused_data)
+            member_start = compressed_position
+            decompressor = zlib.decompressobj(GZIP_WBITS)
+            data = unused_data or file.read(READ_SIZE)
+        else:
+            compressed_position += len(data)
+            data = file.read(READ_SIZE)
+
+
+class GzipDumpReader(io.RawIOBase):
+    """Seekable reader of a gzip file.
+
+    Seeking to a position of the uncompressed stream restarts
+    the decompression from the closest previous checkpoint,
+    so only the window between the checkpoint and the position
+    is decompressed.
+
+    Args:
+        filepath(str): path of a gzip file
+        checkpoints(list): seek points as a list of tuples
+                           [(compressed0, uncompressed0),..]
+    """
+
+    def __init__(self, filepath, checkpoints):
+        super().__init__()
+        self._file = open(filepath, 'rb')
+        checkpoints = sorted(
+            (int(uncompressed), int(compressed))
+            for compressed, uncompressed in checkpoints)
+        self._uncompressed = [uncompressed for uncompressed, _ in checkpoints]
+        self._compressed = [compressed for _, compressed in checkpoints]
+        self._restart(0)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    def _restart(self, checkpoint):
+        """Restart the decompression from a checkpoint"""
+        self._checkpoint = checkpoint
+        self._file.seek(self._compressed[checkpoint])
+        self._decompressor = zlib.decompressobj(GZIP_WBITS)
+        self._position = self._uncompressed[checkpoint]
+        self._buffer = b""
+
+    def _decompress(self):
+        """Decompress the next block, return False at the end of the file"""
+        while not self._buffer:
+            if self._decompressor.eof:
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(GZIP_WBITS)
+                data = data or self._file.read(READ_SIZE)
+            else:
+                data = self._file.read(READ_SIZE)
+            if not data:
+                return False
+            self._buffer = self._decompressor.decompress(data)
+        return True
+
+    def seek(self, position, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("can't seek from the end")
+        checkpoint = bisect.bisect_right(self._uncompressed, position) - 1
+        if checkpoint != self._checkpoint or position < self._position:
+            self._restart(checkpoint)
+        # move forward within the current member
+        while self._position < position and self._decompress():
+            skip = min(position - self._position, len(self._buffer))
+            self._buffer = self._buffer[skip:]
+            self._position += skip
+        return self._position
+
+    def readinto(self, buffer):
+        if not self._decompress():
+            return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self._position += size
+        return size
+
+
+def open_dump(filepath, checkpoints=None, mode='r'):
+    """Open a wikipedia dataset, either plain or compressed
+
+    Args:
+        filepath(str): path of the dataset, gzip files end with '.gz'
+        checkpoints(list): seek points of a gzip file,
+                           see `GzipDumpReader`
+        mode(str): 'r' for text, 'rb' for binary
+
+    Returns:
+        file object
+    """
+    if not is_gzip_file(filepath):
+        return open(filepath, mode)
+    if checkpoints is None:
+        raise ValueError(
+            f"{filepath} is compressed, "
+            f"but the table does not contain its checkpoints")
+    file = io.BufferedReader(GzipDumpReader(filepath, checkpoints))
+    if mode == 'rb':
+        return file
+    return io.TextIOWrapper(file, encoding="utf-8")
+
+
+def write_seekable_gzip(input_filepath, output_filepath,
+                        member_size=MEMBER_SIZE):
+    """Compress a wikipedia dataset as a sequence of small gzip members.
+    Each member contains whole documents, hence each document
+    can be read by decompressing a single member.
+    The output is a regular gzip file.
+
+    Args:
+        input_filepath(str): plain or gzip wikipedia dataset
+        output_filepath(str): destination gzip file
+        member_size(int): uncompressed size of each member, in bytes
+    """
+    opener = gzip.open if is_gzip_file(input_filepath) else open
+    with opener(input_filepath, 'rb') as input_file, \
+            open(output_filepath, 'wb') as output_file:
+        lines = []
+        size = 0
+        for line in input_file:
+            # close the member before a new document
+            if size >= member_size and line.lstrip().startswith(b"<doc>"):
+                output_file.write(gzip.compress(b"".join(lines), mtime=0))
+                lines = []
+                size = 0
+            lines.append(line)
+            size += len(line)
+        if lines:
+            output_file.write(gzip.compress(b"".join(lines), mtime=0))
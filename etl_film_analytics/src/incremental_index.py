@@ -0,0 +1,215 @@
+import os
+import mmap
+import zlib
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+from etl_film_analytics.src.title_index import TitleIndex, TITLE_PREFIX, \
+    RANGES_PER_WORKER, split_file, index_byte_range, read_index_file, \
+    load_title_index, read_segments
+from etl_film_analytics.src.sharded_index import is_sharded_index, \
+    load_sharded_title_index
+
+# average number of documents of a segment
+SEGMENT_DOCUMENTS = 1024
+
+
+def is_segment_boundary(title_line):
+    """Check if a segment starts at a title line.
+    The choice depends only on the content of the line, so an insertion
+    or a deletion in the dump moves the boundaries around it
+    but leaves the other segments unchanged.
+    """
+    return zlib.crc32(title_line) % SEGMENT_DOCUMENTS == 0
+
+
+def find_boundaries(filepath, start, end):
+    """Positions of the segment boundaries in a byte range of a dump
+
+    Returns:
+        list
+    """
+    boundaries = []
+    with open(filepath, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = data.find(TITLE_PREFIX, start, end)
+        while position != -1:
+            line_start = data.rfind(b"\n", start, position) + 1 or start
+            line_end = data.find(b"\n", position, end)
+            if line_end == -1:
+                line_end = end
+            line = data[line_start:line_end].strip()
+            if line.startswith(TITLE_PREFIX) and is_segment_boundary(line):
+                boundaries.append(line_start)
+            position = data.find(TITLE_PREFIX, line_end, end)
+    return boundaries
+
+
+def digest_segments(filepath, starts, ends):
+    """64 bit checksums of the content of a list of segments"""
+    digests = []
+    with open(filepath, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for start, end in zip(starts, ends):
+            digest = hashlib.blake2b(data[start:end], digest_size=8).digest()
+            digests.append(int.from_bytes(digest, "little"))
+    return digests
+
+
+def map_tasks(function, tasks, workers):
+    """Run a function on a list of tasks, with a pool of processes
+    if more than one worker is requested
+    """
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(workers) as pool:
+            return pool.map(function, tasks)
+    return [function(task) for task in tasks]
+
+
+def _find_boundaries(arguments):
+    return find_boundaries(*arguments)
+
+
+def _digest_segments(arguments):
+    return digest_segments(*arguments)
+
+
+def find_segments(filepath, workers=1):
+    """Split an uncompressed dump in segments delimited by its content,
+    see `is_segment_boundary`, and compute the checksum of each segment
+
+    Args:
+        filepath(str): path of a wikipedia dataset
+        workers(int): number of processes
+
+    Returns:
+        tuple=[np.ndarray,np.ndarray,np.ndarray]:
+            start, end and checksum of each segment
+    """
+    file_size = os.path.getsize(filepath)
+    if file_size == 0:
+        return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                np.empty(0, dtype=np.uint64))
+    ranges = split_file(filepath, workers * RANGES_PER_WORKER)
+    boundaries = map_tasks(_find_boundaries, [
+        (filepath, start, end) for start, end in ranges], workers)
+    starts = sorted({0}.union(*boundaries))
+    ends = starts[1:] + [file_size]
+    step = -(-len(starts) // (workers * RANGES_PER_WORKER))
+    digests = map_tasks(_digest_segments, [
+        (filepath, starts[i:i + step], ends[i:i + step])
+        for i in range(0, len(starts), step)], workers)
+    return (np.array(starts, dtype=np.int64),
+            np.array(ends, dtype=np.int64),
+            np.array([digest for chunk in digests for digest in chunk],
+                     dtype=np.uint64))
+
+
+def _index_byte_range(arguments):
+    return index_byte_range(*arguments)
+
+
+def sort_by_position(keys, offsets):
+    """Order the entries of an index by their position in the file"""
+    order = np.argsort(offsets, kind="stable")
+    return np.asarray(keys)[order], np.asarray(offsets)[order]
+
+
+def update_title_index(filepath, index, segments, workers=1, fuzzy=False):
+    """Index a new version of a dump, reusing the entries of a previous index
+    for the segments whose content did not change.
+
+    Every segment of the new dump whose checksum matches a segment
+    of the previous version takes the entries of that segment,
+    shifted to its new position, the other segments are indexed again.
+
+    Args:
+        filepath(str): path of the new version of the dump, uncompressed
+        index(TitleIndex): index of the previous version
+        segments(tuple): segments of the previous version,
+                         see `find_segments`
+        workers(int): number of processes
+        fuzzy(bool): if True, index the normalized titles as well
+
+    Returns:
+        tuple=[TitleIndex,tuple,int]: index and segments of the new version,
+            number of reused segments
+    """
+    new_segments = find_segments(filepath, workers)
+    previous = {}
+    if fuzzy == (index.fuzzy is not None):
+        # identical segments have identical entries, any copy will do
+        previous = {int(digest): (int(start), int(end))
+                    for start, end, digest in zip(*segments)}
+    keys, offsets = sort_by_position(index.keys, index.offsets)
+    fuzzy_keys = None
+    if fuzzy and previous:
+        fuzzy_keys, _ = sort_by_position(index.fuzzy.keys, index.fuzzy.offsets)
+    # entries of the new index, in file order: either the position
+    # of an indexing task or a tuple of reused (keys, offsets, fuzzy keys)
+    parts = []
+    tasks = []
+    reused = 0
+    for start, end, digest in zip(*new_segments):
+        start, end = int(start), int(end)
+        if int(digest) not in previous:
+            # contiguous changed segments are indexed as a single range
+            if tasks and tasks[-1][2] == start:
+                tasks[-1] = (filepath, tasks[-1][1], end, fuzzy)
+            else:
+                tasks.append((filepath, start, end, fuzzy))
+                parts.append(len(tasks) - 1)
+            continue
+        reused += 1
+        previous_start, previous_end = previous[int(digest)]
+        first, last = np.searchsorted(
+            offsets, [previous_start, previous_end], side="left")
+        parts.append((
+            keys[first:last],
+            offsets[first:last] - previous_start + start,
+            fuzzy_keys[first:last] if fuzzy else None
+        ))
+    partial_indexes = map_tasks(_index_byte_range, tasks, workers)
+    parts = [partial_indexes[part] if isinstance(part, int) else part
+             for part in parts]
+    new_index = TitleIndex.from_lists(
+        np.concatenate([np.empty(0, dtype=np.uint64)]
+                       + [part[0] for part in parts]),
+        np.concatenate([np.empty(0, dtype=np.int64)]
+                       + [part[1] for part in parts]),
+        fuzzy_keys=np.concatenate([np.empty(0, dtype=np.uint64)]
+                                  + [part[2] for part in parts])
+        if fuzzy else None
+    )
+    return new_index, new_segments, reused
+
+
+def load_index_for_update(table_filepath):
+    """Read a stored title index, plain or sharded, with its segments
+
+    Returns:
+        tuple=[TitleIndex,tuple]: index, segments (None if missing)
+    """
+    if is_sharded_index(table_filepath):
+        sharded_index = load_sharded_title_index(table_filepath)
+        shards = [sharded_index.open_shard(shard)
+                  for shard in range(sharded_index.number_of_shards)]
+        fuzzy = None
+        if sharded_index.fuzzy is not None:
+            fuzzy = TitleIndex(
+                np.concatenate([shard.fuzzy.keys for shard in shards]),
+                np.concatenate([shard.fuzzy.offsets for shard in shards]))
+        index = TitleIndex(
+            np.concatenate([shard.keys for shard in shards]),
+            np.concatenate([shard.offsets for shard in shards]),
+            sharded_index.checkpoints, fuzzy)
+        segments = None
+        if sharded_index.manifest.get("segments"):
+            arrays, _ = read_index_file(os.path.join(
+                table_filepath, sharded_index.manifest["segments"]))
+            segments = read_segments(arrays)
+        return index, segments
+    arrays, _ = read_index_file(table_filepath)
+    return load_title_index(table_filepath), read_segments(arrays)
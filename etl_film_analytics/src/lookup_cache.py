@@ -0,0 +1,113 @@
+import sqlite3
+
+create_lookups_table = """
+CREATE TABLE IF NOT EXISTS lookups(
+    fingerprint text not null,
+    title text not null,
+    year text not null,
+    wikipedia_page_link text,
+    wikipedia_abstract text,
+    primary key (fingerprint, title, year)
+)
+"""
+delete_outdated_lookups = """
+DELETE FROM lookups WHERE fingerprint != ?
+"""
+select_lookup = """
+SELECT wikipedia_page_link, wikipedia_abstract
+FROM lookups WHERE fingerprint = ? AND title = ? AND year = ?
+"""
+insert_lookups = """
+INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?)
+"""
+
+
+def normalize_document(document):
+    """Key of a document in the cache, with format (title,year)
+    Note: documents without a year generate the same queries,
+        see `search_by_hash.generate_queries`
+    """
+    title, year = document
+    return str(title), str(year) if year else ""
+
+
+class LookupCache:
+    """Persistent cache of the wikipedia features of documents,
+    stored in a SQLite file.
+
+    Each entry is keyed by the normalized (title,year) of a document
+    and by the fingerprint of the wikipedia dataset.
+    Documents without a match are cached as well.
+    Opening the cache for a new version of the dataset
+    evicts the entries of the previous versions.
+
+    Args:
+        cache_filepath(str): path of the SQLite file
+        fingerprint(str): fingerprint of the wikipedia dataset,
+                          see `dump_fingerprint.file_fingerprint`
+    """
+
+    def __init__(self, cache_filepath, fingerprint):
+        self.fingerprint = fingerprint
+        # the cache can be used by a pipeline thread, one at a time
+        self.conn = sqlite3.connect(cache_filepath, check_same_thread=False)
+        self.conn.execute(create_lookups_table)
+        self.conn.execute(delete_outdated_lookups, (fingerprint,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys):
+        """Retrieve the cached documents of the current dataset
+
+        Args:
+            keys(list): normalized documents, see `normalize_document`
+
+        Returns:
+            dict: (title, year) -> (link, abstract)
+        """
+        cached = {}
+        for key in set(keys):
+            row = self.conn.execute(
+                select_lookup, (self.fingerprint, *key)).fetchone()
+            if row is not None:
+                cached[key] = row
+        return cached
+
+    def put_many(self, documents, links, abstracts):
+        """Store the features of a list of documents"""
+        self.conn.executemany(insert_lookups, [
+            (self.fingerprint, *normalize_document(document), link, abstract)
+            for document, link, abstract in zip(documents, links, abstracts)
+        ])
+        self.conn.commit()
+
+
+def get_data_with_cache(cache, documents, lookup):
+    """Extract data from the wikipedia dataset through a persistent cache
+    Only the documents missing from the cache are looked up.
+
+    Args:
+        cache(LookupCache): cache of the wikipedia dataset
+        documents(list): list of tuples with format (title,year)
+        lookup(callable): function that extracts (links, abstracts)
+                          of a list of documents
+
+    Returns:
+        tuple=[list,list]: wikipedia links and abstracts
+    """
+    keys = [normalize_document(document) for document in documents]
+    cached = cache.get_many(keys)
+    missing = [document for document, key in zip(documents, keys)
+               if key not in cached]
+    print(f"Found {len(documents) - len(missing)} films in the cache")
+    if missing:
+        links, abstracts = lookup(missing)
+        cache.put_many(missing, links, abstracts)
+        cached.update(zip(
+            [normalize_document(document) for document in missing],
+            zip(links, abstracts)))
+    wikipedia_links = [cached[key][0] for key in keys]
+    wikipedia_abstracts = [cached[key][1] for key in keys]
+    return wikipedia_links, wikipedia_abstracts
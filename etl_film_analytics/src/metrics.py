@@ -0,0 +1,155 @@
+import sys
+import json
+import time
+import cProfile
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+# query patterns of `search_by_hash.generate_queries`, by importance
+QUERY_PATTERNS = ("year_film", "film", "title")
+
+
+def read_bytes():
+    """Number of bytes read by the current process so far,
+    None if the platform does not expose it
+    """
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss():
+    """Peak resident memory of the current process in bytes,
+    None if the platform does not expose it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macos bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def record_lookup(stats, queries, matched_query):
+    """Count the hits and the misses of the query patterns of a document
+
+    Args:
+        stats(Counter): destination counter, nothing is recorded if None
+        queries(list): queries of a document,
+                       see `search_by_hash.generate_queries`
+        matched_query(str): query that found the document, None if not found
+    """
+    if stats is None:
+        return
+    # documents without a year have no 'year_film' query
+    patterns = QUERY_PATTERNS[len(QUERY_PATTERNS) - len(queries):]
+    for pattern, query in zip(patterns, queries):
+        if query == matched_query:
+            stats[f"{pattern}_hit"] += 1
+            return
+        stats[f"{pattern}_miss"] += 1
+
+
+class Metrics:
+    """Measures of the stages of a run.
+
+    Every stage accumulates, over all its executions:
+        - calls: number of executions
+        - wall_time: elapsed time, in seconds
+        - rows: number of processed rows, reported by the stage
+        - bytes_read: bytes read by the process during the stage
+        - peak_rss: peak resident memory of the process
+          at the end of the stage, in bytes
+        - peak_rss_increase: growth of the peak resident memory
+          during the stage, i.e. the memory the stage added to the peak
+    The lookups counter stores the hits and misses of each query pattern,
+    see `record_lookup`.
+    Note: when stages run concurrently, e.g. in a pipelined run,
+        the bytes read and the memory of a stage include those of the others
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.lookups = Counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a block of code, the block reports its rows
+        by incrementing the 'rows' field of the yielded stage
+        """
+        stage = self.stages.setdefault(name, {
+            "calls": 0, "wall_time": 0.0, "rows": 0, "bytes_read": 0,
+            "peak_rss": None, "peak_rss_increase": None})
+        start = time.perf_counter()
+        start_bytes = read_bytes()
+        start_rss = peak_rss()
+        try:
+            yield stage
+        finally:
+            stage["calls"] += 1
+            stage["wall_time"] += time.perf_counter() - start
+            end_bytes = read_bytes()
+            if start_bytes is not None and end_bytes is not None:
+                stage["bytes_read"] += end_bytes - start_bytes
+            end_rss = peak_rss()
+            if start_rss is not None and end_rss is not None:
+                stage["peak_rss"] = max(stage["peak_rss"] or 0, end_rss)
+                stage["peak_rss_increase"] = \
+                    (stage["peak_rss_increase"] or 0) + end_rss - start_rss
+
+    def iterate(self, name, iterable):
+        """Measure the production of each element of an iterable of sized
+        elements, e.g. the chunks of a dataframe
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name) as stage:
+                try:
+                    element = next(iterator)
+                except StopIteration:
+                    stage["calls"] -= 1
+                    return
+                stage["rows"] += len(element)
+            yield element
+
+    def report(self):
+        """Summary of the run as a json serializable dictionary"""
+        stages = {}
+        for name, stage in self.stages.items():
+            wall_time = stage["wall_time"]
+            stages[name] = dict(
+                stage,
+                rows_per_second=stage["rows"] / wall_time if wall_time else None
+            )
+        return {
+            "wall_time": time.perf_counter() - self.start,
+            "peak_rss": peak_rss(),
+            "stages": stages,
+            "lookups": dict(self.lookups)
+        }
+
+    def save(self, filepath):
+        """Write the report of the run to a json file"""
+        with open(filepath, "w") as file:
+            json.dump(self.report(), file, indent=2)
+
+
+def run_with_profile(function, profile_filepath, *args):
+    """Run a function under cProfile and store the statistics,
+    they can be inspected with `python -m pstats <profile_filepath>`
+    """
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args)
+    finally:
+        profiler.dump_stats(profile_filepath)
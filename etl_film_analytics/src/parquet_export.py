@@ -0,0 +1,126 @@
+import os
+import shutil
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# schema of `sql_queries.films_table_create`
+FILMS_SCHEMA = pa.schema([
+    pa.field("id", pa.int64(), nullable=False),
+    pa.field("title", pa.string(), nullable=False),
+    pa.field("budget", pa.int64(), nullable=False),
+    pa.field("release_year", pa.int32(), nullable=False),
+    pa.field("revenue", pa.int64(), nullable=False),
+    pa.field("vote_average", pa.float64(), nullable=False),
+    pa.field("ratio", pa.float64(), nullable=False),
+    pa.field("production_companies", pa.string(), nullable=False),
+    pa.field("wikipedia_page_link", pa.string()),
+    pa.field("wikipedia_abstract", pa.string()),
+    pa.field("content_hash", pa.string())
+])
+PARTITION_COLUMN = "release_year"
+# rows buffered before being written, they are split by release year
+ROWS_PER_WRITE = 100000
+
+
+def films_partitioning():
+    """Hive partitioning of the films dataset, e.g. release_year=1995/"""
+    return ds.partitioning(
+        pa.schema([FILMS_SCHEMA.field(PARTITION_COLUMN)]), flavor="hive")
+
+
+def to_films_table(df_films):
+    """Convert enriched films to the films schema.
+    Numeric columns encoded as strings are parsed, as the database does.
+
+    Args:
+        df_films(pd.DataFrame): films with the columns of the films table
+
+    Returns:
+        pa.Table
+    """
+    columns = [
+        pa.array(df_films[field.name], from_pandas=True).cast(field.type)
+        for field in FILMS_SCHEMA
+    ]
+    return pa.Table.from_arrays(columns, schema=FILMS_SCHEMA)
+
+
+class ParquetSink:
+    """Write the enriched films as a parquet dataset partitioned by
+    release year, with the schema of the films table.
+
+    The files are written in a temporary directory next to the destination,
+    which replaces the previous dataset only when the sink is committed:
+    readers never see a partial export and an aborted run leaves
+    the previous dataset in place.
+
+    Args:
+        directory(str): destination directory of the dataset
+        rows_per_write(int): number of rows buffered before each write
+    """
+
+    def __init__(self, directory, rows_per_write=ROWS_PER_WRITE):
+        self.directory = os.path.abspath(directory)
+        self.rows_per_write = rows_per_write
+        self.staging_directory = f"{self.directory}.tmp-{os.getpid()}"
+        shutil.rmtree(self.staging_directory, ignore_errors=True)
+        os.makedirs(self.staging_directory)
+        self.tables = []
+        self.buffered_rows = 0
+        self.writes = 0
+
+    def write(self, df_films):
+        """Add a chunk of enriched films to the dataset"""
+        self.tables.append(to_films_table(df_films))
+        self.buffered_rows += len(df_films)
+        if self.buffered_rows >= self.rows_per_write:
+            self.flush()
+
+    def flush(self):
+        if not self.tables:
+            return
+        ds.write_dataset(
+            pa.concat_tables(self.tables),
+            self.staging_directory,
+            format="parquet",
+            partitioning=films_partitioning(),
+            basename_template=f"part-{self.writes:05d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore"
+        )
+        self.writes += 1
+        self.tables = []
+        self.buffered_rows = 0
+
+    def commit(self):
+        """Write the buffered films and publish the dataset"""
+        self.flush()
+        previous_directory = f"{self.directory}.old-{os.getpid()}"
+        if os.path.exists(self.directory):
+            os.rename(self.directory, previous_directory)
+        os.rename(self.staging_directory, self.directory)
+        shutil.rmtree(previous_directory, ignore_errors=True)
+
+    def abort(self):
+        """Discard the films written so far"""
+        self.tables = []
+        shutil.rmtree(self.staging_directory, ignore_errors=True)
+
+
+def read_films(directory, columns=None, filter=None):
+    """Read the films dataset written by `ParquetSink`.
+    Only the requested columns and the partitions and row groups
+    that can satisfy the filter are read.
+
+    Args:
+        directory(str): directory of the dataset
+        columns(list): columns to read, default: all
+        filter(pyarrow.dataset.Expression): condition on the rows,
+            e.g. `ds.field("release_year") >= 2000`
+
+    Returns:
+        pd.DataFrame
+    """
+    dataset = ds.dataset(directory, schema=FILMS_SCHEMA, format="parquet",
+                         partitioning=films_partitioning())
+    return dataset.to_table(columns=columns, filter=filter).to_pandas()
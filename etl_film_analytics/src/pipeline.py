@@ -0,0 +1,78 @@
+import queue
+import threading
+
+# interval at which a blocked producer checks if the consumer has stopped
+POLL_INTERVAL = 0.1
+# marker of the end of the produced elements
+END = object()
+
+
+class Failure:
+    """Exception raised by a producer, re-raised by its consumer"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_in_background(iterable, maxsize=1, name=None):
+    """Produce the elements of an iterable in a background thread
+    while the caller consumes the previous ones.
+
+    At most `maxsize` produced elements wait for the consumer,
+    beyond that the producer blocks (back-pressure).
+    An exception raised by the producer is re-raised by the consumer,
+    after the elements produced before it.
+    If the consumer stops early, e.g. on an error, closing the generator
+    stops the producer and closes its iterable, so chained stages
+    are stopped one after the other.
+    Note: a stage between two background stages has to close its source
+        when it is closed, e.g. a generator function that closes it
+        in `finally`: a generator expression does not close its source
+
+    Args:
+        iterable(iterable): elements to produce, e.g. a generator
+        maxsize(int): maximum number of elements waiting for the consumer
+        name(str): name of the background thread
+
+    Yields:
+        elements of the iterable, in order
+    """
+    elements = queue.Queue(maxsize)
+    stopped = threading.Event()
+
+    def put(element):
+        while not stopped.is_set():
+            try:
+                elements.put(element, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for element in iterator:
+                if not put(element):
+                    return
+            put(END)
+        except BaseException as error:
+            put(Failure(error))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            element = elements.get()
+            if element is END:
+                return
+            if isinstance(element, Failure):
+                raise element.error
+            yield element
+    finally:
+        stopped.set()
+        thread.join()
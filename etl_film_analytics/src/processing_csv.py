@@ -1,13 +1,84 @@
+import re
 import csv
+import ast
+import heapq
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 
+from etl_film_analytics.src.constants import CHUNK_SIZE
 
-def compute_ratio(path_metadata):
+# data model of the film metadata
+METADATA_COLUMN_NAMES = [
+    'adult',
+    'belongs_to_collection',
+    'budget',
+    'genres',
+    'homepage',
+    'id',
+    'imdb_id',
+    'original_language',
+    'original_title',
+    'overview',
+    'popularity',
+    'poster_path',
+    'production_companies',
+    'production_countries',
+    'release_date',
+    'revenue',
+    'runtime',
+    'spoken_languages',
+    'status',
+    'tagline',
+    'title',
+    'video',
+    'vote_average',
+    'vote_count'
+]
+# name field of an encoded dictionary, with single or double quotes
+NAME_PATTERN = re.compile(r"""'name': (?:'([^'\\]*)'|"([^"\\]*)")""")
+# columns encoded as lists of dictionaries with a name field
+LIST_OF_DICTIONARIES_COLUMNS = [
+    "genres",
+    "production_companies",
+    "production_countries",
+    "spoken_languages"
+]
+# bytes of the csv file parsed at once by the streaming reader
+BLOCK_SIZE = 1 << 20
+# columns of the processed dataset
+COLUMNS_OF_INTEREST = [
+    "id",
+    "title",
+    "budget",
+    "release_year",
+    "revenue",
+    "vote_average",
+    "ratio",
+    "production_companies",
+    "company_names"
+]
+# columns of the film metadata needed by the processed dataset
+METADATA_COLUMNS_OF_INTEREST = [
+    "id",
+    "title",
+    "budget",
+    "release_date",
+    "revenue",
+    "vote_average",
+    "production_companies"
+]
+
+
+def compute_ratio(path_metadata, number_of_elements=None):
     """Compute the budget to revenue ratio
 
     Args:
         path_metadata(str): path of the film metadata, as a csv file
+        number_of_elements(int): if given, return only this number
+            of elements with the highest ratio, selected with a heap
 
     Returns:
         list: ratio as a list of tuples [(id0, ratio0),(id1, ratio1)..]
@@ -30,6 +101,13 @@ def compute_ratio(path_metadata):
                 ratio = budget / revenue if (
                         budget != 0 and revenue != 0) else -1
                 budget_to_revenue_ratio.append((id, ratio))
+    if number_of_elements:
+        # partial selection, ties keep the order of the file
+        return heapq.nlargest(
+            number_of_elements,
+            budget_to_revenue_ratio,
+            key=lambda tuple: tuple[1]
+        )
     # sort ratio in descending order
     budget_to_revenue_ratio.sort(key=lambda tuple: -tuple[1])
     return budget_to_revenue_ratio
@@ -45,6 +123,8 @@ def get_metadata(path_metadata, list_of_ids):
     Returns:
         list
     """
+    # constant time membership test
+    list_of_ids = set(list_of_ids)
     rows = []
     with open(path_metadata, newline='') as csvfile:
         # initialise reader and read header
@@ -61,21 +141,40 @@ def get_metadata(path_metadata, list_of_ids):
     return rows
 
 
-def decode_list_of_dictionaries(encoded_list):
-    """Decode a list of dictionaries
+def decode_names(encoded_list):
+    """Decode the names of a list of dictionaries
+
+    Used for the columns in `LIST_OF_DICTIONARIES_COLUMNS`.
 
     Args:
         encoded_list(str): list of dictionaries
                            with format [{"name": name1}, {"name": name2}]
                            encoded as a string
     Returns:
-        str: decoded string with format "name1,name2"
+        list: names with format [name1, name2]
     """
-    decoded_list = eval(encoded_list)
+    matches = NAME_PATTERN.findall(encoded_list)
+    # the names are extracted with a regex, unless they contain
+    # escaped characters, braces or dictionaries without a name
+    if "\\" not in encoded_list and \
+            encoded_list.count("{") == len(matches) and \
+            encoded_list.count("'name'") == len(matches):
+        return [single_quoted or double_quoted
+                for single_quoted, double_quoted in matches]
+    decoded_list = ast.literal_eval(encoded_list)
     companies = []
     for elem in decoded_list:
         companies.append(elem["name"])
-    return ",".join(companies)
+    return companies
+
+
+def decode_list_of_dictionaries(encoded_list):
+    """Decode a list of dictionaries, see `decode_names`
+
+    Returns:
+        str: decoded string with format "name1,name2"
+    """
+    return ",".join(decode_names(encoded_list))
 
 
 def aggregate_data_sources(
@@ -83,6 +182,7 @@ def aggregate_data_sources(
         budget_to_revenue_ratio
 ):
     """Aggregate data from multiple sources
+    Only the columns of interest of the metadata are extracted.
 
     Args:
         film_metadata(list): metadata from films, as a list of list
@@ -92,80 +192,336 @@ def aggregate_data_sources(
     Returns:
         pd.DataFrame
     """
-    # declare data models
-    metadata_column_names = [
-        'adult',
-        'belongs_to_collection',
-        'budget',
-        'genres',
-        'homepage',
-        'id',
-        'imdb_id',
-        'original_language',
-        'original_title',
-        'overview',
-        'popularity',
-        'poster_path',
-        'production_companies',
-        'production_countries',
-        'release_date',
-        'revenue',
-        'runtime',
-        'spoken_languages',
-        'status',
-        'tagline',
-        'title',
-        'video',
-        'vote_average',
-        'vote_count'
-    ]
-    ratio_column_names = ["id", "ratio"]
-    # aggregate and clean dataframes
-    df_metadata = pd.DataFrame(
-        film_metadata, columns=metadata_column_names)
-    df_metadata["id"] = df_metadata["id"].astype(int)
+    columns = {
+        column: [row[METADATA_COLUMN_NAMES.index(column)]
+                 for row in film_metadata]
+        for column in METADATA_COLUMNS_OF_INTEREST
+    }
+    ratio_ids = np.array([film_id for film_id, _ in budget_to_revenue_ratio],
+                         dtype=np.int64)
+    ratios = np.asarray([ratio for _, ratio in budget_to_revenue_ratio])
+    return aggregate_columns(columns, ratio_ids, ratios)
+
+
+def align_ratio(ids, ratio_ids, ratios):
+    """Attach the ratio to the films with the same id,
+    as an inner join: each film takes every ratio of its id,
+    films follow their order and ratios of the same film follow theirs
+    Note: same order of `pd.merge` since pandas 2.2, older versions
+        group the rows of a film listed more than once
+
+    Args:
+        ids(np.ndarray): film identifiers
+        ratio_ids(np.ndarray): identifiers of the ratio
+        ratios(np.ndarray): budget to revenue ratio
+
+    Returns:
+        tuple=[np.ndarray,np.ndarray]: position of the film
+            and ratio of each joined pair
+    """
+    order = np.argsort(ratio_ids, kind="stable")
+    sorted_ids = ratio_ids[order]
+    first = np.searchsorted(sorted_ids, ids, side="left")
+    counts = np.searchsorted(sorted_ids, ids, side="right") - first
+    rows = np.repeat(np.arange(len(ids)), counts)
+    # rank of each pair among the pairs of the same film
+    rank = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, ratios[order[np.repeat(first, counts) + rank]]
+
+
+def select_top_pairs(ids, ratio):
+    """Positions of the pairs of the processed dataset:
+    sorted by descending ratio, only the first pair of each film
+    Note: same selection of `sort_values` and `drop_duplicates`
+        on a dataframe of the pairs
+    """
+    order = pd.Series(ratio).sort_values(ascending=False).index.to_numpy()
+    return order[~pd.Series(ids[order]).duplicated().to_numpy()]
+
+
+def aggregate_columns(columns, ratio_ids, ratios):
+    """Aggregate film metadata with the budget to revenue ratio.
+    The join and the selection work on arrays of ids and ratio,
+    the dataframe is built only for the selected films.
+
+    Args:
+        columns(dict): columns in `METADATA_COLUMNS_OF_INTEREST`
+                       -> values as strings
+        ratio_ids(np.ndarray): identifiers of the ratio
+        ratios(np.ndarray): budget to revenue ratio
+
+    Returns:
+        pd.DataFrame: the index is the position of each film
+            among the joined pairs
+    """
+    ids = np.asarray(columns["id"]).astype(np.int64)
+    rows, ratio = align_ratio(ids, np.asarray(ratio_ids, dtype=np.int64),
+                              np.asarray(ratios))
+    selected = select_top_pairs(ids[rows], ratio)
+    film_rows = rows[selected]
+
+    def take(column, function=None):
+        values = columns[column]
+        if function is None:
+            return [values[row] for row in film_rows]
+        return [function(values[row]) for row in film_rows]
+
+    company_names = take("production_companies", decode_names)
+    # same columns and types of `finalize_metadata`
+    return pd.DataFrame({
+        "id": ids[film_rows],
+        "title": take("title"),
+        "budget": take("budget"),
+        "release_year": pd.Series(
+            take("release_date", lambda date: date.split("-")[0]),
+            index=selected, dtype=object),
+        "revenue": take("revenue"),
+        "vote_average": take("vote_average"),
+        "ratio": ratio[selected],
+        "production_companies": [",".join(names) for names in company_names],
+        "company_names": pd.Series(
+            company_names, index=selected, dtype=object)
+    }, index=selected, columns=COLUMNS_OF_INTEREST)
+
+
+def read_metadata(path_metadata, columns=None):
+    """Read film metadata as columns
+
+    The file is parsed by pyarrow in a single pass,
+    rows with an incorrect number of fields are rejected.
+
+    Args:
+        path_metadata(str): path of the film metadata, as a csv file
+        columns(list): columns to read, default: all
+
+    Returns:
+        pd.DataFrame: metadata as strings
+    """
+    table = pa_csv.read_csv(
+        path_metadata,
+        parse_options=_parse_options(),
+        convert_options=_convert_options(columns or METADATA_COLUMN_NAMES)
+    )
+    return table.to_pandas()
+
+
+def iter_metadata(path_metadata, columns=None, block_size=BLOCK_SIZE):
+    """Read film metadata as a stream of dataframes
+    Note: same parsing rules of `read_metadata`
+
+    Args:
+        path_metadata(str): path of the film metadata, as a csv file
+        columns(list): columns to read, default: all
+        block_size(int): number of bytes parsed at once
+
+    Yields:
+        pd.DataFrame: metadata as strings
+    """
+    reader = pa_csv.open_csv(
+        path_metadata,
+        read_options=pa_csv.ReadOptions(block_size=block_size),
+        parse_options=_parse_options(),
+        convert_options=_convert_options(columns or METADATA_COLUMN_NAMES)
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def _parse_options():
+    return pa_csv.ParseOptions(
+        newlines_in_values=True,
+        # accept rows with correct number of fields
+        invalid_row_handler=lambda row: "skip"
+    )
+
+
+def _convert_options(columns):
+    return pa_csv.ConvertOptions(
+        include_columns=columns,
+        column_types={column: pa.string() for column in columns},
+        strings_can_be_null=False
+    )
+
+
+def compute_ratio_column(budget, revenue):
+    """Compute the budget to revenue ratio of arrays of budgets and revenues
+
+    Returns:
+        np.ndarray: ratio, -1 where budget or revenue are missing
+    """
+    budget = np.asarray(budget, dtype=np.int64)
+    revenue = np.asarray(revenue, dtype=np.int64)
+    valid = (budget != 0) & (revenue != 0)
+    ratio = np.full(len(budget), -1.0)
+    ratio[valid] = budget[valid] / revenue[valid]
+    return ratio
+
+
+def top_ratio_indices(ratio, number_of_elements=None):
+    """Indices of the elements with the highest ratio, in descending order
+    Only the selected elements are sorted, ties keep the order of the array.
+
+    Args:
+        ratio(np.ndarray): budget to revenue ratio
+        number_of_elements(int): number of elements to select, default: all
+
+    Returns:
+        np.ndarray
+    """
+    if not number_of_elements or number_of_elements >= len(ratio):
+        return np.argsort(-ratio, kind="stable")
+    # value of the last selected element
+    threshold = -np.partition(-ratio, number_of_elements - 1)[
+        number_of_elements - 1]
+    above = np.flatnonzero(ratio > threshold)
+    ties = np.flatnonzero(ratio == threshold)[
+        :number_of_elements - len(above)]
+    selected = np.sort(np.concatenate([above, ties]))
+    return selected[np.argsort(-ratio[selected], kind="stable")]
+
+
+def process_metadata_columns(path_metadata, number_of_elements=None):
+    """Process film metadata as columns, with a single read of the file
+    Note: same output of `process_metadata` with engine="csv"
+    """
+    df_metadata = read_metadata(
+        path_metadata, columns=METADATA_COLUMNS_OF_INTEREST)
+    ids = df_metadata["id"].astype(np.int64).values
+    ratio = compute_ratio_column(
+        df_metadata["budget"].values, df_metadata["revenue"].values)
+
+    # retrieve elements with highest ratio
+    top_ratio = top_ratio_indices(ratio, number_of_elements)
+    columns = {column: df_metadata[column].to_numpy()
+               for column in METADATA_COLUMNS_OF_INTEREST}
+    return aggregate_columns(columns, ids[top_ratio], ratio[top_ratio])
+
+
+def add_ratio(df_metadata, first_position=0):
+    """Add id, ratio and row position to a dataframe of film metadata.
+    The rows are labelled by their position in the file,
+    so that the labels of the rows of different blocks do not repeat
+    """
+    df_metadata["id"] = df_metadata["id"].astype(np.int64)
+    df_metadata["ratio"] = compute_ratio_column(
+        df_metadata["budget"].values, df_metadata["revenue"].values)
+    df_metadata["position"] = np.arange(
+        first_position, first_position + len(df_metadata))
+    df_metadata.index = pd.RangeIndex(
+        first_position, first_position + len(df_metadata))
+    return df_metadata
+
+
+def finalize_metadata(df_metadata):
+    """Derive the columns of the processed dataset from film metadata"""
     df_metadata["release_year"] = \
         df_metadata["release_date"].str.split("-").str[0]
+    df_metadata["company_names"] = df_metadata[
+        "production_companies"].apply(decode_names)
     df_metadata["production_companies"] = df_metadata[
-        "production_companies"].apply(decode_list_of_dictionaries)
-    # merge sources
-    df_ratio = pd.DataFrame(
-        budget_to_revenue_ratio, columns=ratio_column_names)
-    df_processed = pd.merge(df_metadata, df_ratio, on="id")
-    # polish processed dataset
-    columns_of_interest = [
-        "id",
-        "title",
-        "budget",
-        "release_year",
-        "revenue",
-        "vote_average",
-        "ratio",
-        "production_companies"
-    ]
-    df_processed = df_processed[columns_of_interest]
-    df_processed = df_processed.sort_values(by="ratio", ascending=False)
-    df_processed = df_processed.drop_duplicates(subset="id")
-    return df_processed
+        "company_names"].apply(",".join)
+    return df_metadata[COLUMNS_OF_INTEREST]
 
 
-def process_metadata(path_metadata, number_of_elements=None):
+def iter_chunks(frames, chunk_size):
+    """Regroup a stream of dataframes in dataframes of chunk_size rows"""
+    buffered = []
+    size = 0
+    for frame in frames:
+        buffered.append(frame)
+        size += len(frame)
+        while size >= chunk_size:
+            frame = pd.concat(buffered)
+            yield frame.iloc[:chunk_size]
+            buffered = [frame.iloc[chunk_size:]]
+            size -= chunk_size
+    if size:
+        yield pd.concat(buffered)
+
+
+def iter_processed_metadata(
+        path_metadata,
+        number_of_elements=None,
+        chunk_size=CHUNK_SIZE,
+        block_size=BLOCK_SIZE
+):
+    """Process film metadata as a stream of chunks
+
+    The file is read in blocks and the memory is bounded
+    by the number of selected elements and the size of the chunks:
+        - with number_of_elements, only the elements with highest ratio
+          seen so far are kept, they are processed and yielded at the end,
+          sorted by ratio
+        - otherwise, each block is processed and yielded as soon as it is read,
+          in the order of the file
+    Duplicated films are yielded once: the one with highest ratio
+    with number_of_elements, the first in the file otherwise.
+
+    Args:
+        path_metadata(str): path of film metadata, as a csv file
+        number_of_elements(int): number of elements with highest ratio
+        chunk_size(int): number of films in each chunk
+        block_size(int): number of bytes parsed at once
+
+    Yields:
+        pd.DataFrame
+    """
+    def iter_blocks():
+        position = 0
+        for df_block in iter_metadata(
+                path_metadata, columns=METADATA_COLUMNS_OF_INTEREST,
+                block_size=block_size):
+            yield add_ratio(df_block, position)
+            position += len(df_block)
+
+    if number_of_elements:
+        top = None
+        for df_block in iter_blocks():
+            top = df_block if top is None else pd.concat([top, df_block])
+            # duplicates are dropped before the selection,
+            # so that number_of_elements distinct films are kept
+            top = top.sort_values(
+                by=["ratio", "position"],
+                ascending=[False, True],
+                kind="mergesort"
+            ).drop_duplicates(subset="id").head(number_of_elements)
+        if top is None:
+            return
+        for df_chunk in iter_chunks([top], chunk_size):
+            yield finalize_metadata(df_chunk.copy())
+        return
+
+    loaded_ids = set()
+
+    def iter_new_films():
+        for df_block in iter_blocks():
+            df_block = df_block.drop_duplicates(subset="id")
+            df_block = df_block[~df_block["id"].isin(loaded_ids)]
+            loaded_ids.update(df_block["id"].tolist())
+            yield df_block
+
+    for df_chunk in iter_chunks(iter_new_films(), chunk_size):
+        yield finalize_metadata(df_chunk.copy())
+
+
+def process_metadata(path_metadata, number_of_elements=None, engine="arrow"):
     """Process film metadata
 
     Args:
         path_metadata(str): path of film metadata, as a csv file
         number_of_elements(int): from the list of elements with highest budget
             to revenue ratio, extract only this number of elements
+        engine(str): arrow: read the file once as columns,
+                     csv: read the file twice, row by row
 
     Returns:
         pd.DataFrame
 
     """
-    budget_to_revenue_ratio = compute_ratio(path_metadata)
-
+    if engine == "arrow":
+        return process_metadata_columns(path_metadata, number_of_elements)
     # retrieve elements with highest ratio
-    number_of_elements = number_of_elements or len(budget_to_revenue_ratio)
-    budget_to_revenue_ratio = budget_to_revenue_ratio[:number_of_elements]
+    budget_to_revenue_ratio = compute_ratio(path_metadata, number_of_elements)
     top_ratio_ids = [tuple[0] for tuple in budget_to_revenue_ratio]
     film_metadata = get_metadata(path_metadata, list_of_ids=top_ratio_ids)
 
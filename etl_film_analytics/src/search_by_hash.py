@@ -1,5 +1,50 @@
+import io
+import os
 import re
+import json
+import html
 import pickle
+from xml.sax.saxutils import escape
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from etl_film_analytics.src.gzip_dump import open_dump
+from etl_film_analytics.src.metrics import record_lookup
+from etl_film_analytics.src.fuzzy_titles import normalize_title, \
+    score_candidate, best_score
+from etl_film_analytics.src.dump_fingerprint import check_dump_fingerprint
+from etl_film_analytics.src.title_index import is_index_file, \
+    load_title_index, read_index_file
+from etl_film_analytics.src.sharded_index import is_sharded_index, \
+    load_sharded_title_index, MANIFEST_FILENAME
+
+# size of the blocks read by the batched search
+CHUNK_SIZE = 1 << 20
+# the title, url and abstract lines of a document fit in this size
+DOCUMENT_HEAD_SIZE = 1 << 16
+# size of the first read of a document, most documents fit in it
+DOCUMENT_READ_SIZE = 1 << 12
+DOCUMENT_END = b"</doc>"
+# documents read by a fuzzy lookup, at most: the lookups of titles
+# shared by more documents are counted as fuzzy_truncated
+MAX_FUZZY_CANDIDATES = 64
+
+# title, url and abstract of a document, the url and the abstract
+# have to follow the title, the abstract can span several lines.
+# The text of the fields is XML escaped, hence it does not contain '<'
+DOCUMENT_PATTERN = re.compile(
+    rb"[ \t]*<title>Wikipedia: ([^<\n]*)</title>\s*"
+    rb"(?:<url>([^<\n]*)</url>\s*)?"
+    rb"(?:<abstract>([^<]*)</abstract>)?"
+)
+# predefined entities of XML
+XML_ENTITIES = [
+    (b"&lt;", b"<"),
+    (b"&gt;", b">"),
+    (b"&quot;", b'"'),
+    (b"&apos;", b"'"),
+    (b"&amp;", b"&"),
+]
 
 
 def create_hash_table(file):
@@ -30,74 +75,129 @@ def create_hash_table(file):
     return hash_table
 
 
-def read_document_abstract(file):
-    """Read the abstract field of a wikipedia document
-    Note: the cursor of the file has to point the beginning
-        of the abstract field
+def read_block(file, position, size):
+    """Read a block of a file at a given position.
+    Files on disk are read with a single positional read,
+    the other files (e.g. gzip readers) with a seek and a read.
     """
-    lines = []
-    while True:
-        line = file.readline().strip()
-        # the cursor points to the abstract field, start reading
-        if "<abstract>" in line:
-            lines.append(line)
-            if "</abstract>" in line:
-                abstract_text = " ".join(lines)
-                match = re.search("<abstract>(.*)</abstract>", abstract_text)
-                abstract = match.group(1)
-                return abstract
-        else:
-            # the cursor was not pointing to the abstract field
-            return None
+    try:
+        fileno = file.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        fileno = None
+    if fileno is None or not hasattr(os, "pread"):
+        file.seek(position)
+        return file.read(size)
+    return os.pread(fileno, size, position)
+
+
+def read_document_bytes(file, document_position):
+    """Read a whole document with as few reads as possible
+
+    Args:
+        file(BufferedReader): wikipedia dataset file, opened in binary mode
+        document_position(int): position of the title line of the document
+
+    Returns:
+        bytes: the document, from its title line to its end
+    """
+    data = read_block(file, document_position, DOCUMENT_READ_SIZE)
+    end = data.find(DOCUMENT_END)
+    while end == -1:
+        block = read_block(file, document_position + len(data), len(data))
+        if not block:
+            return data
+        searched = len(data) - len(DOCUMENT_END)
+        data += block
+        end = data.find(DOCUMENT_END, searched)
+    return data[:end]
+
+
+def parse_document(data):
+    """Extract the features of a document
+
+    Args:
+        data(bytes): document, from its title line to its end,
+                     see `read_document_bytes`
+
+    Returns:
+        tuple=[str,str,str]
+    """
+    match = DOCUMENT_PATTERN.match(data)
+    if match is None:
+        return None, None, None
+    title, url, abstract = match.groups()
+    if abstract is not None and b"\n" in abstract:
+        # abstract on several lines, joined as single line
+        lines = abstract.split(b"\n")
+        abstract = b" ".join(
+            [lines[0].rstrip()]
+            + [line.strip() for line in lines[1:-1]]
+            + [lines[-1].lstrip()]
+        )
+    return decode_field(title), decode_field(url), decode_field(abstract)
+
+
+def decode_field(field):
+    """Decode the text of a field and its XML entities"""
+    if field is None:
+        return None
+    if b"&" not in field:
+        return field.decode("utf-8")
+    if b"&#" in field:
+        # character references
+        return html.unescape(field.decode("utf-8"))
+    # '&amp;' is the last one, to not decode twice
+    for entity, character in XML_ENTITIES:
+        field = field.replace(entity, character)
+    return field.decode("utf-8")
 
 
 def read_document(file, document_position):
     """Read a document and extract its features
 
     Args:
-        file(TextIOWrapper): pointer to wikipedia dataset file
+        file(BufferedReader): pointer to wikipedia dataset file,
+                              text files are read through their buffer
         document_position(int): position of a document in the file,
-                                expressed as the number of characters from
+                                expressed as the number of bytes from
                                 the beginning of the file
 
     Returns:
         tuple=[str,str,str]
     """
-    # reach document position
-    file.seek(document_position)
-    # read raw title and url
-    title_line = file.readline()
-    url_line = file.readline()
-    abstract = read_document_abstract(file)
-    # extract title and url
-    title = re.search("<title>Wikipedia: (.*)</title>", title_line)
-    url = re.search("<url>(.*)</url>", url_line)
-    # get processed data
-    title = title.group(1) if title else None
-    url = url.group(1) if url else None
-    return title, url, abstract
-
-
-def get_document_features(file, document, table):
-    """Search a document in a wikipedia file and extract its features
+    # text files share the position of their buffer after a seek
+    binary_file = getattr(file, "buffer", file)
+    return parse_document(read_document_bytes(binary_file, document_position))
 
-    The feature extraction is done with an hash table,
-    in particular:
-        - document's title is used to query the hash table
-        - the table returns the location of the queried string in the original file
-        - the file is accessed in O(1) time at the given location
-        - the feature is extracted
+
+def get_document_position(file, query, table):
+    """Search a line in a table and return its position in the file
+
+    Args:
+        file(BufferedReader): pointer to wikipedia dataset file
+        query(str): line without trailing spaces
+        table(dict or TitleIndex): hash table of the input file
+
+    Returns:
+        int: position of the line, None if not found
+    """
+    if isinstance(table, dict):
+        return table.get(query)
+    return table.get(query, file)
+
+
+def generate_queries(document):
+    """Generate the title lines of a document, sorted by importance
 
     Args:
-        file(TextIOWrapper): pointer to wikipedia dataset file
         document(tuple): tuple of document keywords with format (title,year)
-        table(dict): hash table of the input file
 
     Returns:
-        tuple=[str,str,str]
+        list
     """
     title, year = document
-    # generate title lines, sorted by importance
+    # the titles of the dataset are XML escaped
+    title = escape(str(title))
     queries = []
     document_pattern = "<title>Wikipedia: %s</title>"
     if year:
@@ -108,59 +208,465 @@ def get_document_features(file, document, table):
         document_pattern % f"{title} (film)",
         document_pattern % title
     ]
+    return queries
+
+
+def get_document_features(file, document, table, stats=None):
+    """Search a document in a wikipedia file and extract its features
+
+    The feature extraction is done with an hash table,
+    in particular:
+        - document's title is used to query the hash table
+        - the table returns the location of the queried string
+          in the original file
+        - the file is accessed in O(1) time at the given location
+        - the feature is extracted
+    If no title matches and the table has a secondary index,
+    the document is searched by its normalized title,
+    see `get_fuzzy_document_features`.
+
+    Args:
+        file(BufferedReader): pointer to wikipedia dataset file
+        document(tuple): tuple of document keywords with format (title,year)
+        table(dict or TitleIndex): hash table of the input file
+        stats(Counter): hits and misses of the query patterns,
+                        see `metrics.record_lookup`
+
+    Returns:
+        tuple=[str,str,str]
+    """
+    queries = generate_queries(document)
     # check if the table contains one of the generated lines
-    document = [None, None, None]
+    features = [None, None, None]
+    matched_query = None
     for query in queries:
-        if query in table:
+        document_position = get_document_position(file, query, table)
+        if document_position is not None:
             # return features of the first matched document (most probable one)
-            document_position = table[query]
-            document = read_document(file, document_position)
+            features = read_document(file, document_position)
+            matched_query = query
             break
-    return document
+    record_lookup(stats, queries, matched_query)
+    if matched_query is None and getattr(table, "fuzzy", None) is not None:
+        features = get_fuzzy_document_features(
+            file, document, table, stats) or features
+    return features
 
 
-def get_documents_features(file, documents, table):
+def get_fuzzy_document_features(file, document, table, stats=None,
+                                max_candidates=MAX_FUZZY_CANDIDATES):
+    """Search a document by its normalized title
+
+    The documents whose title has the same normalized form are read
+    and the one that mentions the release year is selected,
+    see `fuzzy_titles.score_candidate`.
+    The candidates are scored in turn, the reads stop at a document
+    with the best possible score or after max_candidates documents.
+
+    Args:
+        file(BufferedReader): pointer to wikipedia dataset file
+        document(tuple): tuple of document keywords with format (title,year)
+        table(TitleIndex): title index with a secondary index
+        stats(Counter): hits and misses of the fuzzy lookups
+                        and lookups with more than max_candidates candidates
+        max_candidates(int): maximum number of documents read
+
+    Returns:
+        tuple=[str,str,str]: None if not found
+    """
+    title, year = document
+    key = normalize_title(str(title))
+    best_features = None
+    highest_score = 0
+    target_score = best_score(year)
+    if key:
+        candidates = table.fuzzy.candidates(key)
+        if len(candidates) > max_candidates and stats is not None:
+            stats["fuzzy_truncated"] += 1
+        for position in candidates[:max_candidates]:
+            features = read_document(file, position)
+            # confirm the match, to rule out hash collisions
+            if features[0] is None or normalize_title(features[0]) != key:
+                continue
+            score = score_candidate(features, year)
+            if score > highest_score:
+                best_features = features
+                highest_score = score
+                if score == target_score:
+                    break
+    if stats is not None:
+        stats["fuzzy_hit" if best_features else "fuzzy_miss"] += 1
+    return best_features
+
+
+def get_documents_features(file, documents, table, stats=None):
     """Extract documents' features from the wikipedia dataset
     """
     documents_features = []
     for document in documents:
-        document = get_document_features(file, document, table)
+        document = get_document_features(file, document, table, stats)
         documents_features.append(document)
     return documents_features
 
 
+def get_candidate_positions(query, table):
+    """Positions of the lines that could match a query,
+    without accessing the file
+
+    Args:
+        query(str): line without trailing spaces
+        table(dict or TitleIndex): hash table of the input file
+
+    Returns:
+        list
+    """
+    if isinstance(table, dict):
+        return [table[query]] if query in table else []
+    return table.candidates(query)
+
+
+def read_documents_sorted(file, positions, chunk_size=CHUNK_SIZE):
+    """Read documents in a single forward pass over the file
+
+    Documents that are close to each other are extracted from the same read,
+    of at most chunk_size bytes, that ends after the head of the last one.
+    An isolated document is read alone, with the size of a document.
+
+    Args:
+        file(BufferedReader): wikipedia dataset file, opened in binary mode
+        positions(list): sorted positions of the documents
+        chunk_size(int): maximum size of each read, in bytes
+
+    Returns:
+        dict: position -> (title line, document features)
+    """
+    documents = {}
+    chunk_size = max(chunk_size, DOCUMENT_HEAD_SIZE)
+    chunk = b""
+    chunk_start = 0
+    chunk_end = 0
+    end_of_file = False
+    for i, position in enumerate(positions):
+        # the head of the document has to be in the current chunk
+        if position < chunk_start or (
+                position + DOCUMENT_HEAD_SIZE > chunk_end and not end_of_file):
+            chunk, end_of_file = read_documents_chunk(
+                file, positions, i, chunk_size)
+            chunk_start = position
+            chunk_end = position + len(chunk)
+        title_line, data = split_document(chunk, position - chunk_start)
+        documents[position] = (title_line, parse_document(data))
+    return documents
+
+
+def read_documents_chunk(file, positions, first, chunk_size):
+    """Read the documents that follow a position, see `read_documents_sorted`
+
+    Args:
+        file(BufferedReader): wikipedia dataset file, opened in binary mode
+        positions(list): sorted positions of the documents
+        first(int): index of the first document to read
+        chunk_size(int): maximum size of the read, in bytes
+
+    Returns:
+        tuple=[bytes,bool]: data from the first document,
+            True if the read reached the end of the file
+    """
+    start = positions[first]
+    last = first
+    while last + 1 < len(positions) and \
+            positions[last + 1] + DOCUMENT_HEAD_SIZE <= start + chunk_size:
+        last += 1
+    if last > first:
+        size = positions[last] - start + DOCUMENT_HEAD_SIZE
+        data = read_block(file, start, size)
+        return data, len(data) < size
+    # most documents fit in a small read, the others in the size of a head
+    data = read_block(file, start, DOCUMENT_READ_SIZE)
+    if len(data) == DOCUMENT_READ_SIZE and DOCUMENT_END not in data:
+        data = read_block(file, start, DOCUMENT_HEAD_SIZE)
+        return data, len(data) < DOCUMENT_HEAD_SIZE
+    return data, len(data) < DOCUMENT_READ_SIZE
+
+
+def split_document(buffer, start):
+    """Extract a document from a buffer
+
+    Args:
+        buffer(bytes): block of the wikipedia dataset
+        start(int): position of the title line of the document in the buffer
+
+    Returns:
+        tuple=[str,bytes]: title line without trailing spaces,
+            used to confirm the matches of the table, and the document
+    """
+    end = buffer.find(DOCUMENT_END, start, start + DOCUMENT_HEAD_SIZE)
+    if end == -1:
+        end = start + DOCUMENT_HEAD_SIZE
+    data = buffer[start:end]
+    title_line = data.split(b"\n", 1)[0].strip().decode("utf-8")
+    return title_line, data
+
+
+def get_documents_features_batched(
+        file,
+        documents,
+        table,
+        chunk_size=CHUNK_SIZE,
+        stats=None
+):
+    """Extract documents' features reading the file sequentially
+
+    The documents are extracted in 3 steps:
+        - every query is resolved to the positions of its candidates
+        - the candidates are sorted and read in a single forward pass
+        - the matches are selected with the priority of
+          `get_document_features` and returned in the input order
+    A candidate that does not match its query (hash collision) is rare,
+    the candidates that follow it are read in an additional pass.
+    The documents without a match are searched by their normalized title,
+    if the table has a secondary index.
+
+    Args:
+        file(BufferedReader): wikipedia dataset file, opened in binary mode
+        documents(list): list of tuples with format (title,year)
+        table(dict or TitleIndex): hash table of the input file
+        chunk_size(int): size of each read, in bytes
+        stats(Counter): hits and misses of the query patterns,
+                        see `metrics.record_lookup`
+
+    Returns:
+        list
+    """
+    documents_queries = [
+        [(query, get_candidate_positions(query, table))
+         for query in generate_queries(document)]
+        for document in documents
+    ]
+    documents_features = [None] * len(documents)
+    read_documents = {}
+    pending = list(range(len(documents)))
+    while pending:
+        positions = set()
+        still_pending = []
+        for i in pending:
+            document, position = select_document(
+                documents_queries[i], read_documents)
+            if position is None:
+                documents_features[i] = document
+                record_lookup(
+                    stats,
+                    [query for query, _ in documents_queries[i]],
+                    select_query(documents_queries[i], read_documents)
+                )
+            else:
+                positions.add(position)
+                still_pending.append(i)
+        read_documents.update(read_documents_sorted(
+            file, sorted(positions), chunk_size=chunk_size))
+        pending = still_pending
+    if getattr(table, "fuzzy", None) is not None:
+        # documents without an exact match
+        for i, features in enumerate(documents_features):
+            if features[0] is None:
+                documents_features[i] = get_fuzzy_document_features(
+                    file, documents[i], table, stats) or features
+    return documents_features
+
+
+def select_document(queries, read_documents):
+    """Select the most important match among the documents read so far
+
+    Args:
+        queries(list): queries sorted by importance,
+                       with format (query, candidate positions)
+        read_documents(dict): documents read from the file,
+                              see `read_documents_sorted`
+
+    Returns:
+        tuple=[list,int]: features of the matched document
+            and None, or None and the next position to read
+    """
+    for query, candidates in queries:
+        for position in candidates:
+            if position not in read_documents:
+                return None, position
+            title_line, document = read_documents[position]
+            if title_line == query:
+                return document, None
+    return [None, None, None], None
+
+
+def select_query(queries, read_documents):
+    """Query matched by `select_document`, None if nothing matched"""
+    for query, candidates in queries:
+        for position in candidates:
+            if read_documents[position][0] == query:
+                return query
+    return None
+
+
 def search_documents_by_hash(
         file,
         documents,
         table,
+        sort_by_position=True,
+        workers=1,
+        stats=None,
         **kwargs
 ):
     """Load wikipedia dataset from path and extract documents' features
+    Note: gzip datasets are read through the checkpoints of the table
+
+    Args:
+        sort_by_position(bool): if True, read the documents in the order
+            of the file, see `get_documents_features_batched`
+        workers(int): number of threads, each one searches a slice
+            of the documents with its own file handle
+        stats(Counter): hits and misses of the query patterns,
+                        see `metrics.record_lookup`
     """
-    with open(file, 'r') as text_file:
+    if workers > 1 and len(documents) > 1:
+        slice_size = -(-len(documents) // workers)
+        slices = [documents[i:i + slice_size]
+                  for i in range(0, len(documents), slice_size)]
+        # each thread counts in its own counter
+        slices_stats = [Counter() for _ in slices]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            slices_features = executor.map(
+                lambda documents_slice, slice_stats: search_documents_by_hash(
+                    file,
+                    documents_slice,
+                    table,
+                    sort_by_position=sort_by_position,
+                    stats=slice_stats
+                ),
+                slices,
+                slices_stats
+            )
+            documents_features = [features
+                                  for slice_features in slices_features
+                                  for features in slice_features]
+        if stats is not None:
+            for slice_stats in slices_stats:
+                stats.update(slice_stats)
+        return documents_features
+    checkpoints = getattr(table, "checkpoints", None)
+    if sort_by_position:
+        with open_dump(file, checkpoints, mode='rb') as binary_file:
+            return get_documents_features_batched(
+                binary_file,
+                documents,
+                table,
+                stats=stats
+            )
+    with open_dump(file, checkpoints, mode='rb') as binary_file:
         documents_features = get_documents_features(
-            text_file,
+            binary_file,
             documents,
             table,
+            stats=stats
         )
     return documents_features
 
 
+def load_table(table_filepath, wikipedia_filepath=None):
+    """Load the table of a wikipedia dataset from disk.
+    Title indexes are memory mapped, sharded indexes are opened lazily,
+    other tables are unpickled.
+
+    Args:
+        table_filepath(str): path of the table
+        wikipedia_filepath(str): if given, the table is checked against
+                                 this version of the dataset,
+                                 see `check_table_source`
+    """
+    if wikipedia_filepath is not None:
+        check_table_source(table_filepath, wikipedia_filepath)
+    if is_sharded_index(table_filepath):
+        return load_sharded_title_index(table_filepath)
+    if is_index_file(table_filepath):
+        return load_title_index(table_filepath)
+    with open(table_filepath, 'rb') as table_file:
+        return pickle.load(table_file)
+
+
+def read_table_source(table_filepath):
+    """Fingerprint of the dataset a table was built from,
+    None for tables without it, e.g. dictionary tables
+    """
+    if is_sharded_index(table_filepath):
+        with open(os.path.join(table_filepath, MANIFEST_FILENAME)) as file:
+            return json.load(file).get("source")
+    if is_index_file(table_filepath):
+        _, metadata = read_index_file(table_filepath)
+        return metadata.get("source")
+    return None
+
+
+def has_fuzzy_index(table_filepath):
+    """Check if a table has a secondary index of normalized titles,
+    without loading it
+    """
+    if is_sharded_index(table_filepath):
+        with open(os.path.join(table_filepath, MANIFEST_FILENAME)) as file:
+            return bool(json.load(file).get("fuzzy"))
+    if is_index_file(table_filepath):
+        arrays, _ = read_index_file(table_filepath)
+        return "fuzzy_keys" in arrays
+    return False
+
+
+def check_table_source(table_filepath, wikipedia_filepath):
+    """Check that a table has been built from the current version
+    of the wikipedia dataset: the offsets of a table built from another
+    version point to the wrong documents
+
+    Raises:
+        ValueError: if the table was built from another version
+    """
+    source = read_table_source(table_filepath)
+    if source is None:
+        print(f"Warning: {table_filepath} does not record the dataset "
+              f"it was built from, it cannot be validated")
+        return
+    try:
+        check_dump_fingerprint(source, wikipedia_filepath)
+    except ValueError as error:
+        raise ValueError(
+            f"{table_filepath} is out of date: {error}. "
+            f"Update it with create_hash_table.py --update") from error
+
+
 def get_data_from_wikipedia(
         file,
         documents,
         table_filepath,
+        lookup_workers=1,
         **kwargs
 ):
     """Extract data from the wikipedia dataset"""
     print(f"Loading hash table from {table_filepath}..")
-    with open(table_filepath, 'rb') as table_file:
-        table = pickle.load(table_file)
+    table = load_table(table_filepath, file)
+    return get_data_from_table(file, documents, table, lookup_workers)
+
+
+def get_data_from_table(
+        file,
+        documents,
+        table,
+        lookup_workers=1,
+        stats=None,
+        **kwargs
+):
+    """Extract data from the wikipedia dataset with a loaded table"""
     print(f"Querying features for {len(documents)} films from wikipedia..")
     documents_features = search_documents_by_hash(
         file,
         documents,
         table,
+        workers=lookup_workers,
+        stats=stats
     )
     wikipedia_links = [document[1] for document in documents_features]
     wikipedia_abstracts = [document[2] for document in documents_features]
@@ -0,0 +1,99 @@
+import gzip
+
+from etl_film_analytics.src.gzip_dump import is_gzip_file
+from etl_film_analytics.src.metrics import record_lookup
+from etl_film_analytics.src.title_index import TITLE_PREFIX
+from etl_film_analytics.src.search_by_hash import generate_queries, \
+    split_document, parse_document, CHUNK_SIZE, DOCUMENT_HEAD_SIZE
+
+
+def scan_documents(file, queries, block_size=CHUNK_SIZE):
+    """Read a wikipedia file once and extract the documents
+    whose title line belongs to a set of queries
+
+    Args:
+        file(BufferedReader): wikipedia dataset file, opened in binary mode
+        queries(set): title lines without trailing spaces, encoded as bytes
+        block_size(int): size of each read, in bytes
+
+    Returns:
+        dict: title line -> document features
+    """
+    documents = {}
+    buffer = b""
+    while True:
+        block = file.read(block_size)
+        end_of_file = not block
+        buffer += block
+        # process the titles whose document head is in the buffer,
+        # the others are processed with the next block
+        limit = len(buffer)
+        if not end_of_file:
+            limit = buffer.rfind(
+                b"\n", 0, max(0, limit - DOCUMENT_HEAD_SIZE)) + 1
+        position = buffer.find(TITLE_PREFIX, 0, limit)
+        while position != -1:
+            line_start = buffer.rfind(b"\n", 0, position) + 1
+            line_end = buffer.find(b"\n", position)
+            if line_end == -1:
+                line_end = len(buffer)
+            line = buffer[line_start:line_end].strip()
+            if line in queries:
+                # duplicates: the last one in the file wins
+                title_line, data = split_document(buffer, line_start)
+                documents[title_line] = parse_document(data)
+            position = buffer.find(TITLE_PREFIX, line_end, limit)
+        if end_of_file:
+            return documents
+        buffer = buffer[limit:]
+
+
+def search_documents_by_scan(file, documents, stats=None):
+    """Extract documents' features with a single scan of the wikipedia dataset
+    The title lines of all the documents are generated in advance
+    and the matches are selected with the priority of
+    `search_by_hash.get_document_features`.
+    Note: no table is needed, plain and gzip datasets are supported
+
+    Args:
+        file(str): path of the wikipedia dataset
+        documents(list): list of tuples with format (title,year)
+        stats(Counter): hits and misses of the query patterns,
+                        see `metrics.record_lookup`
+
+    Returns:
+        list
+    """
+    documents_queries = [generate_queries(document) for document in documents]
+    queries = {query.encode("utf-8")
+               for document_queries in documents_queries
+               for query in document_queries}
+    opener = gzip.open if is_gzip_file(file) else open
+    with opener(file, 'rb') as binary_file:
+        matches = scan_documents(binary_file, queries)
+    documents_features = []
+    for document_queries in documents_queries:
+        document = [None, None, None]
+        matched_query = None
+        for query in document_queries:
+            if query in matches:
+                document = matches[query]
+                matched_query = query
+                break
+        record_lookup(stats, document_queries, matched_query)
+        documents_features.append(document)
+    return documents_features
+
+
+def get_data_from_wikipedia(
+        file,
+        documents,
+        stats=None,
+        **kwargs
+):
+    """Extract data from the wikipedia dataset, without a table"""
+    print(f"Scanning wikipedia for {len(documents)} films..")
+    documents_features = search_documents_by_scan(file, documents, stats)
+    wikipedia_links = [document[1] for document in documents_features]
+    wikipedia_abstracts = [document[2] for document in documents_features]
+    return wikipedia_links, wikipedia_abstracts
@@ -0,0 +1,178 @@
+import os
+import json
+import threading
+
+import numpy as np
+
+from etl_film_analytics.src.title_index import TitleIndex, hash_title, \
+    write_index_file, read_index_file, load_title_index, segment_arrays
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_FORMAT = "sharded-title-index"
+CHECKPOINTS_FILENAME = "checkpoints.idx"
+SEGMENTS_FILENAME = "segments.idx"
+
+
+def shard_filename(shard):
+    return f"shard-{shard:04d}.idx"
+
+
+def is_sharded_index(path):
+    """Check if a path is the directory of a sharded index"""
+    return os.path.isfile(os.path.join(path, MANIFEST_FILENAME))
+
+
+def partition_keys(keys, offsets, number_of_shards):
+    """Split sorted keys and their offsets by shard, the order is kept
+
+    Returns:
+        list: tuples with format (keys, offsets), one per shard
+    """
+    shards = keys % np.uint64(number_of_shards)
+    return [(keys[shards == shard], offsets[shards == shard])
+            for shard in range(number_of_shards)]
+
+
+def save_sharded_title_index(index, directory, number_of_shards,
+                             source=None, segments=None):
+    """Store a title index as a set of shards partitioned by key.
+
+    The directory contains:
+        - manifest.json: number of shards, titles of each shard, ..
+        - shard-NNNN.idx: title index of the keys k with k % shards == NNNN,
+          its header stores the manifest of the shard
+        - checkpoints.idx: seek points of gzip datasets, if any
+        - segments.idx: segments of the dump, if any
+
+    Args:
+        index(TitleIndex): index to store
+        directory(str): destination directory, created if missing
+        number_of_shards(int): number of shards
+        source(dict): fingerprint of the indexed dump,
+                      see `dump_fingerprint.dump_fingerprint`
+        segments(tuple): segments of the indexed dump,
+                         see `incremental_index.find_segments`
+    """
+    os.makedirs(directory, exist_ok=True)
+    partitions = partition_keys(index.keys, index.offsets, number_of_shards)
+    fuzzy_partitions = None
+    if index.fuzzy is not None:
+        fuzzy_partitions = partition_keys(
+            index.fuzzy.keys, index.fuzzy.offsets, number_of_shards)
+    shards = []
+    for shard, (keys, offsets) in enumerate(partitions):
+        arrays = {"keys": keys, "offsets": offsets}
+        if fuzzy_partitions is not None:
+            arrays["fuzzy_keys"], arrays["fuzzy_offsets"] = \
+                fuzzy_partitions[shard]
+        shard_manifest = {
+            "shard": shard,
+            "number_of_shards": number_of_shards,
+            "titles": len(keys)
+        }
+        write_index_file(
+            os.path.join(directory, shard_filename(shard)),
+            arrays,
+            metadata=shard_manifest
+        )
+        shards.append(dict(shard_manifest, file=shard_filename(shard)))
+    checkpoints = None
+    if index.checkpoints is not None:
+        checkpoints = CHECKPOINTS_FILENAME
+        write_index_file(
+            os.path.join(directory, checkpoints),
+            {"checkpoints": np.asarray(index.checkpoints).reshape(-1)}
+        )
+    if segments is not None:
+        write_index_file(os.path.join(directory, SEGMENTS_FILENAME),
+                         segment_arrays(segments))
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "source": source,
+        "segments": SEGMENTS_FILENAME if segments is not None else None,
+        "number_of_shards": number_of_shards,
+        "titles": len(index),
+        "fuzzy": index.fuzzy is not None,
+        "checkpoints": checkpoints,
+        "shards": shards
+    }
+    with open(os.path.join(directory, MANIFEST_FILENAME), "w") as file:
+        json.dump(manifest, file, indent=2)
+
+
+class ShardedTitleIndex(TitleIndex):
+    """Title index stored as a set of shards, see `save_sharded_title_index`
+
+    Each query is routed to the shard of its key,
+    the shards are memory mapped at their first query:
+    a process maps only the shards it touches.
+    The index can be restricted to a subset of shards,
+    e.g. to query separate shards from separate processes.
+
+    Args:
+        directory(str): directory of the sharded index
+        manifest(dict): content of manifest.json
+        shards(list): shards that can be queried, default: all of them
+        primary(ShardedTitleIndex): if given, this index queries
+            the secondary indexes of the shards opened by the primary one
+    """
+
+    def __init__(self, directory, manifest, shards=None, primary=None):
+        self.directory = directory
+        self.manifest = manifest
+        self.number_of_shards = manifest["number_of_shards"]
+        self.shards = set(range(self.number_of_shards)
+                          if shards is None else shards)
+        self.primary = primary
+        self.opened_shards = {}
+        self.lock = threading.Lock()
+        self._checkpoints = None
+        self.fuzzy = None
+        if manifest["fuzzy"] and primary is None:
+            self.fuzzy = ShardedTitleIndex(
+                directory, manifest, shards=self.shards, primary=self)
+
+    def __len__(self):
+        if self.primary is not None:
+            return len(self.primary)
+        return sum(self.manifest["shards"][shard]["titles"]
+                   for shard in self.shards)
+
+    @property
+    def checkpoints(self):
+        if self._checkpoints is None and self.manifest["checkpoints"]:
+            arrays, _ = read_index_file(os.path.join(
+                self.directory, self.manifest["checkpoints"]))
+            self._checkpoints = np.asarray(
+                arrays["checkpoints"]).reshape(-1, 2)
+        return self._checkpoints
+
+    def shard_of(self, query):
+        """Shard of a query, a title line or a normalized title"""
+        return hash_title(query) % self.number_of_shards
+
+    def open_shard(self, shard):
+        """Memory map a shard, once"""
+        if self.primary is not None:
+            return self.primary.open_shard(shard).fuzzy
+        if shard not in self.opened_shards:
+            if shard not in self.shards:
+                raise KeyError(f"shard {shard} is not part of this index")
+            with self.lock:
+                if shard not in self.opened_shards:
+                    self.opened_shards[shard] = load_title_index(
+                        os.path.join(self.directory, shard_filename(shard)))
+        return self.opened_shards[shard]
+
+    def key_candidates(self, key):
+        shard = self.open_shard(key % self.number_of_shards)
+        return shard.key_candidates(key)
+
+
+def load_sharded_title_index(directory, shards=None):
+    """Open a sharded title index, no shard is mapped in advance"""
+    with open(os.path.join(directory, MANIFEST_FILENAME)) as file:
+        manifest = json.load(file)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        raise ValueError(f"{directory} is not a sharded title index")
+    return ShardedTitleIndex(directory, manifest, shards=shards)
@@ -1,10 +1,33 @@
-table_names = ["films"]
+table_names = ["films", "companies", "film_companies"]
+view_names = ["top_films_per_year"]
+# films of each release year in the top_films_per_year view
+TOP_FILMS_PER_YEAR = 10
 
 """Drop"""
 films_table_drop = """
 DROP TABLE IF EXISTS films
 """
 
+companies_table_drop = """
+DROP TABLE IF EXISTS companies
+"""
+
+film_companies_table_drop = """
+DROP TABLE IF EXISTS film_companies
+"""
+
+top_films_per_year_drop = """
+DROP MATERIALIZED VIEW IF EXISTS top_films_per_year
+"""
+
+# dependent objects first
+drop_queries = [
+    top_films_per_year_drop,
+    film_companies_table_drop,
+    companies_table_drop,
+    films_table_drop
+]
+
 """Create"""
 films_table_create = ("""
 CREATE TABLE IF NOT EXISTS films(
@@ -17,10 +40,131 @@ CREATE TABLE IF NOT EXISTS films(
     ratio float not null,
     production_companies varchar not null,
     wikipedia_page_link varchar,
-    wikipedia_abstract varchar 
+    wikipedia_abstract varchar,
+    content_hash varchar
+);
+""")
+
+films_table_add_content_hash = """
+ALTER TABLE films ADD COLUMN IF NOT EXISTS content_hash varchar
+"""
+
+companies_table_create = ("""
+CREATE TABLE IF NOT EXISTS companies(
+    id serial primary key,
+    name varchar not null unique
 );
 """)
 
+film_companies_table_create = ("""
+CREATE TABLE IF NOT EXISTS film_companies(
+    film_id bigint not null references films(id) on delete cascade,
+    company_id int not null references companies(id),
+    position int not null,
+    primary key (film_id, company_id)
+);
+""")
+
+"""Indexes"""
+films_ratio_index_create = """
+CREATE INDEX IF NOT EXISTS films_ratio_idx ON films (ratio)
+"""
+
+films_release_year_index_create = """
+CREATE INDEX IF NOT EXISTS films_release_year_idx ON films (release_year)
+"""
+
+# films of a company, the primary key serves the companies of a film
+film_companies_company_index_create = """
+CREATE INDEX IF NOT EXISTS film_companies_company_id_idx
+ON film_companies (company_id)
+"""
+
+"""Views"""
+top_films_per_year_create = f"""
+CREATE MATERIALIZED VIEW IF NOT EXISTS top_films_per_year AS
+SELECT release_year, rank, id, title, ratio, vote_average
+FROM (
+    SELECT release_year, id, title, ratio, vote_average,
+        row_number() OVER (
+            PARTITION BY release_year ORDER BY ratio DESC, id
+        ) AS rank
+    FROM films
+) AS ranked_films
+WHERE rank <= {TOP_FILMS_PER_YEAR}
+"""
+
+# required by the concurrent refresh
+top_films_per_year_index_create = """
+CREATE UNIQUE INDEX IF NOT EXISTS top_films_per_year_id_idx
+ON top_films_per_year (id)
+"""
+
+# the view can be read while it is refreshed
+top_films_per_year_refresh = """
+REFRESH MATERIALIZED VIEW CONCURRENTLY top_films_per_year
+"""
+
+# tables first, then what depends on them
+create_queries = [
+    films_table_create,
+    films_table_add_content_hash,
+    companies_table_create,
+    film_companies_table_create,
+    films_ratio_index_create,
+    films_release_year_index_create,
+    film_companies_company_index_create,
+    top_films_per_year_create,
+    top_films_per_year_index_create
+]
+
+film_companies_staging_create = """
+CREATE TEMPORARY TABLE IF NOT EXISTS film_companies_staging(
+    film_id bigint not null,
+    position int not null,
+    name varchar not null
+) ON COMMIT DROP
+"""
+
+film_companies_staging_truncate = """
+TRUNCATE film_companies_staging
+"""
+
+films_staging_create = """
+CREATE TEMPORARY TABLE IF NOT EXISTS films_staging (LIKE films) ON COMMIT DROP
+"""
+
+films_staging_truncate = """
+TRUNCATE films_staging
+"""
+
+"""Columns"""
+films_table_columns = [
+    "id",
+    "title",
+    "budget",
+    "release_year",
+    "revenue",
+    "vote_average",
+    "ratio",
+    "production_companies",
+    "wikipedia_page_link",
+    "wikipedia_abstract",
+    "content_hash"
+]
+# columns used to detect a change of a film, listed by name:
+# a new column of the table does not change the hash of the loaded films
+films_content_columns = [
+    "id",
+    "title",
+    "budget",
+    "release_year",
+    "revenue",
+    "vote_average",
+    "ratio",
+    "production_companies"
+]
+
 """Insert Pandas->SQL"""
 films_table_insert = """
 insert into films (
@@ -33,6 +177,88 @@ insert into films (
     ratio,
     production_companies,
     wikipedia_page_link,
-    wikipedia_abstract
-) values (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);
+    wikipedia_abstract,
+    content_hash
+) values (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s);
+"""
+
+"""Bulk insert Pandas->SQL"""
+films_table_copy = f"""
+copy films ({", ".join(films_table_columns)}) from stdin
+"""
+
+films_table_insert_values = f"""
+insert into films ({", ".join(films_table_columns)}) values %s;
+"""
+
+films_staging_copy = f"""
+copy films_staging ({", ".join(films_table_columns)}) from stdin
+"""
+
+films_staging_insert_values = f"""
+insert into films_staging ({", ".join(films_table_columns)}) values %s;
+"""
+
+film_companies_staging_columns = ["film_id", "position", "name"]
+
+film_companies_staging_copy = f"""
+copy film_companies_staging ({", ".join(film_companies_staging_columns)})
+from stdin
+"""
+
+film_companies_staging_insert_values = f"""
+insert into film_companies_staging (
+    {", ".join(film_companies_staging_columns)}
+) values %s;
+"""
+
+"""Upsert staging->films"""
+films_table_upsert = f"""
+insert into films ({", ".join(films_table_columns)})
+select {", ".join(films_table_columns)} from films_staging
+on conflict (id) do update set
+    {", ".join(f"{column} = excluded.{column}"
+               for column in films_content_columns[1:] + ["content_hash"])},
+    wikipedia_page_link = coalesce(
+        excluded.wikipedia_page_link, films.wikipedia_page_link),
+    wikipedia_abstract = coalesce(
+        excluded.wikipedia_abstract, films.wikipedia_abstract)
+where films.content_hash is distinct from excluded.content_hash
+    or (films.wikipedia_page_link is null
+        and excluded.wikipedia_page_link is not null);
+"""
+
+"""Select"""
+# films without companies are complete if they have no company to load,
+# e.g. the films loaded before the companies tables existed are not
+films_table_select_loaded = """
+select
+    id,
+    content_hash,
+    wikipedia_page_link is not null,
+    production_companies = '' or exists (
+        select 1 from film_companies where film_companies.film_id = films.id
+    )
+from films
+"""
+
+"""Upsert staging->companies"""
+companies_table_insert_staging = """
+insert into companies (name)
+select distinct name from film_companies_staging
+on conflict (name) do nothing;
+"""
+
+# the companies of the loaded films are replaced,
+# including the films that have no company anymore
+film_companies_table_delete = """
+delete from film_companies where film_id = any(%s);
+"""
+
+film_companies_table_insert_staging = """
+insert into film_companies (film_id, company_id, position)
+select staging.film_id, companies.id, staging.position
+from film_companies_staging as staging
+join companies on companies.name = staging.name
+on conflict (film_id, company_id) do nothing;
 """
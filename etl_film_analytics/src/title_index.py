@@ -0,0 +1,444 @@
+import os
+import json
+import mmap
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+from etl_film_analytics.src.gzip_dump import is_gzip_file, \
+    iter_gzip_members, MAX_MEMBER_SIZE
+from etl_film_analytics.src.fuzzy_titles import normalize_title_line
+
+TITLE_PREFIX = b"<title>Wikipedia: "
+DOCUMENT_START = b"<doc>"
+# number of byte ranges assigned to each worker, to balance the load
+RANGES_PER_WORKER = 4
+
+# on-disk format: magic, header size, json header, aligned arrays
+INDEX_MAGIC = b"ETLTIDX1"
+INDEX_ALIGNMENT = 64
+
+
+def hash_title(title_line):
+    """Compute a stable 64 bit hash of a title line
+
+    Args:
+        title_line(str or bytes): title line without trailing spaces,
+                                  e.g. '<title>Wikipedia: Heat</title>'
+
+    Returns:
+        int
+    """
+    if isinstance(title_line, str):
+        title_line = title_line.encode("utf-8")
+    digest = hashlib.blake2b(title_line, digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class TitleIndex:
+    """Compact index of the title lines of a wikipedia dataset.
+
+    Only the '<title>Wikipedia: ...</title>' lines are indexed.
+    Each line is stored as the 64 bit hash of its content,
+    together with its position in the file:
+        - keys: sorted array of hashed title lines
+        - offsets: position of each title line, in bytes
+    Indexes of gzip files also store the seek points of the file:
+        - checkpoints: array of (compressed, uncompressed) positions
+    Optionally, a secondary index maps the normalized form of each title
+    to the position of its title line:
+        - fuzzy: TitleIndex of the normalized titles,
+                 see `fuzzy_titles.normalize_title`
+
+    Two different titles can share the same hash,
+    hence every match is confirmed against the file itself.
+    """
+
+    def __init__(self, keys, offsets, checkpoints=None, fuzzy=None):
+        self.keys = keys
+        self.offsets = offsets
+        self.checkpoints = checkpoints
+        self.fuzzy = fuzzy
+
+    @classmethod
+    def from_lists(cls, keys, offsets, checkpoints=None, fuzzy_keys=None):
+        """Create an index from unsorted lists of keys and offsets,
+        the secondary index is created from the keys of the normalized titles
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if checkpoints is not None:
+            checkpoints = np.asarray(checkpoints, dtype=np.int64)
+        fuzzy = None
+        if fuzzy_keys is not None:
+            fuzzy = cls.from_lists(fuzzy_keys, offsets)
+        # sort by key, then by position in the file
+        order = np.lexsort((offsets, keys))
+        return cls(keys[order], offsets[order], checkpoints, fuzzy)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def candidates(self, query):
+        """Positions of the title lines that share the hash of the query,
+        sorted from the last to the first line in the file
+        """
+        return self.key_candidates(hash_title(query))
+
+    def key_candidates(self, key):
+        """Positions of the title lines with a given hash, see `candidates`"""
+        key = np.uint64(key)
+        start = np.searchsorted(self.keys, key, side="left")
+        end = np.searchsorted(self.keys, key, side="right")
+        return [int(offset) for offset in self.offsets[start:end][::-1]]
+
+    def get(self, query, file):
+        """Search a title line in the index
+
+        Args:
+            query(str): title line without trailing spaces
+            file(TextIOWrapper): pointer to the indexed file
+
+        Returns:
+            int: position of the title line, None if not found
+        """
+        # duplicated titles: the last one in the file wins,
+        # as it happens in the dictionary table
+        for offset in self.candidates(query):
+            file.seek(offset)
+            line = file.readline()
+            if isinstance(line, bytes):
+                line = line.decode("utf-8")
+            if line.strip() == query:
+                return offset
+        return None
+
+
+def create_title_index(file, fuzzy=False):
+    """Create a title index of a wikipedia dataset
+
+    Args:
+        file(BufferedReader): pointer to a file on disk, opened in binary mode
+        fuzzy(bool): if True, index the normalized titles as well
+
+    Returns:
+        TitleIndex
+    """
+    keys = []
+    offsets = []
+    fuzzy_keys = [] if fuzzy else None
+    position = 0
+    for line in file:
+        stripped = line.strip()
+        if stripped.startswith(TITLE_PREFIX):
+            keys.append(hash_title(stripped))
+            offsets.append(position)
+            if fuzzy:
+                fuzzy_keys.append(hash_title(normalize_title_line(stripped)))
+        position += len(line)
+    return TitleIndex.from_lists(keys, offsets, fuzzy_keys=fuzzy_keys)
+
+
+def split_file(filepath, number_of_ranges):
+    """Split a file in byte ranges that start at the beginning of a document
+
+    Args:
+        filepath(str): path of a wikipedia dataset
+        number_of_ranges(int): maximum number of ranges
+
+    Returns:
+        list: ranges as a list of tuples [(start0, end0),(start1, end1)..]
+    """
+    file_size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, 'rb') as file:
+        for i in range(1, number_of_ranges):
+            target = file_size * i // number_of_ranges
+            if target <= boundaries[-1]:
+                continue
+            # skip the partial line, then reach the next document
+            file.seek(target - 1)
+            file.readline()
+            while True:
+                position = file.tell()
+                line = file.readline()
+                if not line or line.lstrip().startswith(DOCUMENT_START):
+                    break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    boundaries.append(file_size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if end > start]
+
+
+def index_byte_range(filepath, start, end, fuzzy=False):
+    """Index the title lines of a byte range of a wikipedia dataset
+
+    Returns:
+        tuple=[np.ndarray,np.ndarray,np.ndarray]: keys, offsets
+            and keys of the normalized titles (None if not fuzzy)
+    """
+    keys = []
+    offsets = []
+    fuzzy_keys = [] if fuzzy else None
+    with open(filepath, 'rb') as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        index_buffer(data, start, end, keys, offsets, fuzzy_keys=fuzzy_keys)
+    if fuzzy:
+        fuzzy_keys = np.array(fuzzy_keys, dtype=np.uint64)
+    return (np.array(keys, dtype=np.uint64),
+            np.array(offsets, dtype=np.int64),
+            fuzzy_keys)
+
+
+def index_buffer(data, start, end, keys, offsets, base_offset=0,
+                 fuzzy_keys=None):
+    """Append the title lines of a buffer to lists of keys and offsets
+
+    Args:
+        data(bytes or mmap): buffer of whole lines
+        start(int): position of the first line in the buffer
+        end(int): end of the last line in the buffer
+        keys(list): destination list of hashed title lines
+        offsets(list): destination list of positions
+        base_offset(int): position of the buffer in the file
+        fuzzy_keys(list): destination list of hashed normalized titles,
+                          None to skip them
+    """
+    # jump from title to title, the other lines are never decoded
+    position = data.find(TITLE_PREFIX, start, end)
+    while position != -1:
+        line_start = data.rfind(b"\n", start, position) + 1 or start
+        line_end = data.find(b"\n", position, end)
+        if line_end == -1:
+            line_end = end
+        line = data[line_start:line_end].strip()
+        if line.startswith(TITLE_PREFIX):
+            keys.append(hash_title(line))
+            offsets.append(base_offset + line_start)
+            if fuzzy_keys is not None:
+                fuzzy_keys.append(hash_title(normalize_title_line(line)))
+        position = data.find(TITLE_PREFIX, line_end, end)
+
+
+def create_gzip_title_index(filepath, fuzzy=False,
+                            max_member_size=MAX_MEMBER_SIZE):
+    """Create a title index of a gzip wikipedia dataset.
+    The file is decompressed once, the offsets refer to the uncompressed
+    stream and the beginning of each gzip member is recorded as a checkpoint.
+    The checkpoints are the only seek points: a file made of large members,
+    e.g. a dump compressed as a single member, is rejected.
+
+    Args:
+        filepath(str): path of a gzip wikipedia dataset
+        fuzzy(bool): if True, index the normalized titles as well
+        max_member_size(int): uncompressed size of the largest member
+
+    Returns:
+        TitleIndex
+
+    Raises:
+        ValueError: if a member is larger than max_member_size
+    """
+    keys = []
+    offsets = []
+    fuzzy_keys = [] if fuzzy else None
+    checkpoints = []
+    # incomplete line at the end of the previous block
+    remainder = b""
+    remainder_position = 0
+    with open(filepath, 'rb') as file:
+        for member_start, position, block in iter_gzip_members(file):
+            if not checkpoints or checkpoints[-1][0] != member_start:
+                checkpoints.append((member_start, position))
+            if position + len(block) - checkpoints[-1][1] > max_member_size:
+                raise ValueError(
+                    f"{filepath} has a gzip member larger than "
+                    f"{max_member_size} bytes: each query would decompress "
+                    f"it from its beginning. Recompress it in small members "
+                    f"with create_seekable_gzip.py "
+                    f"(gzip_dump.write_seekable_gzip)")
+            data = remainder + block
+            end = data.rfind(b"\n") + 1
+            index_buffer(data, 0, end, keys, offsets,
+                         base_offset=remainder_position,
+                         fuzzy_keys=fuzzy_keys)
+            remainder = data[end:]
+            remainder_position += end
+    index_buffer(remainder, 0, len(remainder), keys, offsets,
+                 base_offset=remainder_position, fuzzy_keys=fuzzy_keys)
+    return TitleIndex.from_lists(keys, offsets, checkpoints or [(0, 0)],
+                                 fuzzy_keys=fuzzy_keys)
+
+
+def _index_byte_range(arguments):
+    return index_byte_range(*arguments)
+
+
+def build_title_index(filepath, workers=1, fuzzy=False):
+    """Create a title index of a wikipedia dataset with a pool of processes.
+    The file is split in byte ranges aligned to the documents,
+    each range is indexed by a worker and the partial indexes are merged.
+
+    Gzip files are decompressed by a single process,
+    see `create_gzip_title_index`.
+
+    Args:
+        filepath(str): path of a wikipedia dataset
+        workers(int): number of processes
+        fuzzy(bool): if True, index the normalized titles as well
+
+    Returns:
+        TitleIndex
+    """
+    if is_gzip_file(filepath):
+        return create_gzip_title_index(filepath, fuzzy=fuzzy)
+    if os.path.getsize(filepath) == 0:
+        return TitleIndex.from_lists([], [], fuzzy_keys=[] if fuzzy else None)
+    ranges = split_file(filepath, workers * RANGES_PER_WORKER)
+    tasks = [(filepath, start, end, fuzzy) for start, end in ranges]
+    if workers > 1:
+        with multiprocessing.Pool(workers) as pool:
+            partial_indexes = pool.map(_index_byte_range, tasks)
+    else:
+        partial_indexes = [_index_byte_range(task) for task in tasks]
+    keys = np.concatenate([keys for keys, _, _ in partial_indexes])
+    offsets = np.concatenate([offsets for _, offsets, _ in partial_indexes])
+    fuzzy_keys = None
+    if fuzzy:
+        fuzzy_keys = np.concatenate(
+            [fuzzy_keys for _, _, fuzzy_keys in partial_indexes])
+    return TitleIndex.from_lists(keys, offsets, fuzzy_keys=fuzzy_keys)
+
+
+def write_index_file(filepath, arrays, metadata=None):
+    """Store a set of arrays in a file that can be memory mapped
+
+    The file has the following layout:
+        - magic string (8 bytes)
+        - size of the header (8 bytes, little endian)
+        - json header with name, dtype, length and position of each array
+        - arrays, aligned to 64 bytes
+
+    Args:
+        filepath(str): destination path
+        arrays(dict): name -> np.ndarray
+        metadata(dict): additional json serializable information
+    """
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    header = {"arrays": {}, "metadata": metadata or {}}
+    # the header size depends on the array positions, iterate until stable
+    header_size = 0
+    while True:
+        position = _align(len(INDEX_MAGIC) + 8 + header_size)
+        for name, array in arrays.items():
+            header["arrays"][name] = {
+                "dtype": array.dtype.str,
+                "length": len(array),
+                "offset": position
+            }
+            position = _align(position + array.nbytes)
+        encoded_header = json.dumps(header).encode("utf-8")
+        if len(encoded_header) == header_size:
+            break
+        header_size = len(encoded_header)
+    with open(filepath, "wb") as file:
+        file.write(INDEX_MAGIC)
+        file.write(header_size.to_bytes(8, "little"))
+        file.write(encoded_header)
+        for name, array in arrays.items():
+            file.seek(header["arrays"][name]["offset"])
+            file.write(array.tobytes())
+
+
+def read_index_file(filepath):
+    """Memory map the arrays stored by `write_index_file`
+
+    Returns:
+        tuple=[dict,dict]: arrays and metadata
+    """
+    with open(filepath, "rb") as file:
+        if file.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError(f"{filepath} is not an index file")
+        header_size = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_size).decode("utf-8"))
+    arrays = {}
+    for name, info in header["arrays"].items():
+        if info["length"] == 0:
+            # an empty region cannot be mapped
+            arrays[name] = np.empty(0, dtype=info["dtype"])
+            continue
+        arrays[name] = np.memmap(
+            filepath,
+            dtype=info["dtype"],
+            mode="r",
+            offset=info["offset"],
+            shape=(info["length"],)
+        )
+    return arrays, header["metadata"]
+
+
+def is_index_file(filepath):
+    """Check if a file has been stored by `write_index_file`"""
+    with open(filepath, "rb") as file:
+        return file.read(len(INDEX_MAGIC)) == INDEX_MAGIC
+
+
+def segment_arrays(segments):
+    """Arrays of the segments of a dump, see `incremental_index.find_segments`
+    """
+    starts, ends, digests = segments
+    return {"segment_starts": starts, "segment_ends": ends,
+            "segment_digests": digests}
+
+
+def read_segments(arrays):
+    """Segments stored by `segment_arrays`, None if missing"""
+    if "segment_starts" not in arrays:
+        return None
+    return (arrays["segment_starts"], arrays["segment_ends"],
+            arrays["segment_digests"])
+
+
+def save_title_index(index, filepath, source=None, segments=None):
+    """Store a title index on disk
+
+    Args:
+        index(TitleIndex): index to store
+        filepath(str): destination path
+        source(dict): fingerprint of the indexed dump,
+                      see `dump_fingerprint.dump_fingerprint`
+        segments(tuple): segments of the indexed dump,
+                         see `incremental_index.find_segments`
+    """
+    arrays = {"keys": index.keys, "offsets": index.offsets}
+    if index.checkpoints is not None:
+        arrays["checkpoints"] = np.asarray(index.checkpoints).reshape(-1)
+    if index.fuzzy is not None:
+        arrays["fuzzy_keys"] = index.fuzzy.keys
+        arrays["fuzzy_offsets"] = index.fuzzy.offsets
+    if segments is not None:
+        arrays.update(segment_arrays(segments))
+    write_index_file(filepath, arrays, metadata={"source": source})
+
+
+def load_title_index(filepath):
+    """Open a title index stored on disk.
+    The arrays are memory mapped: nothing is read in advance,
+    the pages touched by a lookup are read on demand
+    and shared with the other processes that open the same file.
+    """
+    arrays, _ = read_index_file(filepath)
+    checkpoints = arrays.get("checkpoints")
+    if checkpoints is not None:
+        checkpoints = np.asarray(checkpoints).reshape(-1, 2)
+    fuzzy = None
+    if "fuzzy_keys" in arrays:
+        fuzzy = TitleIndex(arrays["fuzzy_keys"], arrays["fuzzy_offsets"])
+    return TitleIndex(arrays["keys"], arrays["offsets"], checkpoints, fuzzy)
+
+
+def _align(position):
+    return -(-position // INDEX_ALIGNMENT) * INDEX_ALIGNMENT
@@ -1,20 +1,261 @@
-import pandas as pd
-from tabulate import tabulate
+import io
+import hashlib
+
+import psycopg2
 
 from etl_film_analytics.src import sql_queries
+from etl_film_analytics.src.constants import BATCH_SIZE
+
+# escape sequences of the text format of COPY
+COPY_ESCAPES = str.maketrans({
+    "\\": "\\\\",
+    "\t": "\\t",
+    "\n": "\\n",
+    "\r": "\\r"
+})
 
 
 def reset_tables(conn):
     """Drop and create from scratch each table in the database"""
     cur = conn.cursor()
-    cur.execute(sql_queries.films_table_drop)
-    cur.execute(sql_queries.films_table_create)
+    for query in sql_queries.drop_queries:
+        cur.execute(query)
+    for query in sql_queries.create_queries:
+        cur.execute(query)
+    conn.commit()
+
+
+def create_tables(conn):
+    """Create the tables, indexes and views that do not exist,
+    without dropping the others
+    """
+    cur = conn.cursor()
+    for query in sql_queries.create_queries:
+        cur.execute(query)
     conn.commit()
 
 
 def check_database_content(table_names, conn):
     """Check top 5 elements for each table"""
+    from tabulate import tabulate
+    cur = conn.cursor()
     for table in table_names:
-        df = pd.read_sql(f"""SELECT * from {table} LIMIT 5""", conn)
+        cur.execute(f"""SELECT * from {table} LIMIT 5""")
+        columns = [column[0] for column in cur.description]
         print(table)
-        print(tabulate(df, headers=df.columns, tablefmt="psql"))
+        print(tabulate(cur.fetchall(), headers=columns, showindex=True,
+                       tablefmt="psql"))
+
+
+def format_copy_value(value, missing=False):
+    """Encode a value in the text format of COPY"""
+    if missing or value is None:
+        return "\\N"
+    return str(value).translate(COPY_ESCAPES)
+
+
+def format_copy_rows(df):
+    """Encode the rows of a dataframe in the text format of COPY
+
+    Returns:
+        io.StringIO
+    """
+    buffer = io.StringIO()
+    # missing values (None, NaN, ..) are detected on the whole dataframe
+    missing_values = df.isna().to_numpy()
+    for row, row_missing in zip(df.itertuples(index=False, name=None),
+                                missing_values):
+        buffer.write("\t".join(
+            format_copy_value(value, missing)
+            for value, missing in zip(row, row_missing)))
+        buffer.write("\n")
+    buffer.seek(0)
+    return buffer
+
+
+def copy_dataframe(cur, df, copy_query, batch_size=BATCH_SIZE):
+    """Stream a dataframe into a table with COPY, one batch at a time"""
+    for start in range(0, len(df), batch_size):
+        buffer = format_copy_rows(df.iloc[start:start + batch_size])
+        cur.copy_expert(copy_query, buffer)
+
+
+def insert_dataframe(cur, df, insert_query, batch_size=BATCH_SIZE):
+    """Insert a dataframe into a table with multi-row INSERT statements"""
+    import pandas as pd
+    from psycopg2.extras import execute_values
+    # python objects, missing values as NULL
+    df = df.astype(object).where(pd.notna(df), None)
+    execute_values(
+        cur,
+        insert_query,
+        df.itertuples(index=False, name=None),
+        page_size=batch_size
+    )
+
+
+def bulk_insert(conn, df, copy_query, insert_query, batch_size=BATCH_SIZE):
+    """Load a dataframe into a table.
+    The rows are sent with COPY, if the database does not support it
+    they are sent with batches of INSERT statements.
+    Note: the transaction is not committed
+
+    Args:
+        conn(connection): connection to the database
+        df(pd.DataFrame): rows to load, columns sorted as in the queries
+        copy_query(str): COPY ... FROM STDIN statement
+        insert_query(str): INSERT ... VALUES %s statement
+        batch_size(int): number of rows sent at once
+    """
+    cur = conn.cursor()
+    cur.execute("SAVEPOINT bulk_insert")
+    try:
+        copy_dataframe(cur, df, copy_query, batch_size)
+    except psycopg2.NotSupportedError:
+        cur.execute("ROLLBACK TO SAVEPOINT bulk_insert")
+        insert_dataframe(cur, df, insert_query, batch_size)
+    cur.execute("RELEASE SAVEPOINT bulk_insert")
+
+
+def load_films(conn, df, batch_size=BATCH_SIZE):
+    """Load films into the films table, see `bulk_insert`"""
+    bulk_insert(
+        conn,
+        df[sql_queries.films_table_columns],
+        sql_queries.films_table_copy,
+        sql_queries.films_table_insert_values,
+        batch_size=batch_size
+    )
+
+
+def explode_companies(df):
+    """Rows of the film_companies staging table: one row per company
+    of each film, with its position in the list of the film
+
+    Args:
+        df(pd.DataFrame): films with id and company_names columns
+
+    Returns:
+        pd.DataFrame: columns sorted as `film_companies_staging_columns`
+    """
+    import pandas as pd
+    rows = [(film_id, position, name)
+            for film_id, names in zip(df["id"], df["company_names"])
+            for position, name in enumerate(names)]
+    return pd.DataFrame(
+        rows, columns=sql_queries.film_companies_staging_columns)
+
+
+def load_film_companies(conn, df, batch_size=BATCH_SIZE):
+    """Load the companies of a set of films.
+    The (film, company) pairs are loaded into a staging table, then:
+        - new company names are inserted into the companies table
+        - the previous companies of the films are replaced
+    Note: the transaction is not committed
+
+    Args:
+        conn(connection): connection to the database
+        df(pd.DataFrame): films with id and company_names columns,
+                          already in the films table
+        batch_size(int): number of rows sent at once
+    """
+    cur = conn.cursor()
+    cur.execute(sql_queries.film_companies_staging_create)
+    cur.execute(sql_queries.film_companies_staging_truncate)
+    bulk_insert(
+        conn,
+        explode_companies(df),
+        sql_queries.film_companies_staging_copy,
+        sql_queries.film_companies_staging_insert_values,
+        batch_size=batch_size
+    )
+    cur.execute(sql_queries.companies_table_insert_staging)
+    cur.execute(sql_queries.film_companies_table_delete,
+                ([int(film_id) for film_id in df["id"]],))
+    cur.execute(sql_queries.film_companies_table_insert_staging)
+
+
+def refresh_views(conn):
+    """Refresh the materialized views from the current tables
+    Note: the transaction is not committed
+    """
+    cur = conn.cursor()
+    cur.execute(sql_queries.top_films_per_year_refresh)
+
+
+def compute_content_hash(df):
+    """Fingerprint of the metadata of each film,
+    the wikipedia columns are excluded
+
+    Returns:
+        list: md5 digest of each row
+    """
+    return [
+        hashlib.md5("\x1f".join(map(str, row)).encode("utf-8")).hexdigest()
+        for row in df[sql_queries.films_content_columns].itertuples(
+            index=False, name=None)
+    ]
+
+
+def get_loaded_films(conn):
+    """Retrieve the films already in the database
+
+    Returns:
+        dict: id -> (content hash, True if the film has a wikipedia link,
+                     True if its companies are loaded)
+    """
+    cur = conn.cursor()
+    cur.execute(sql_queries.films_table_select_loaded)
+    return {film_id: (content_hash, has_link, has_companies)
+            for film_id, content_hash, has_link, has_companies
+            in cur.fetchall()}
+
+
+def select_films_to_refresh(df, loaded_films):
+    """Select the films that are new or changed since the last load
+
+    Args:
+        df(pd.DataFrame): films with a content_hash column
+        loaded_films(dict): see `get_loaded_films`
+
+    Returns:
+        tuple=[pd.DataFrame,pd.Series]: films to load and a mask
+            of the films that need a wikipedia lookup
+    """
+    import pandas as pd
+    loaded = [loaded_films.get(film_id, (None, False, False))
+              for film_id in df["id"]]
+    unchanged = pd.Series(
+        [content_hash == loaded_hash
+         for content_hash, (loaded_hash, _, _)
+         in zip(df["content_hash"], loaded)],
+        index=df.index)
+    has_link = pd.Series(
+        [has_link for _, has_link, _ in loaded], index=df.index)
+    has_companies = pd.Series(
+        [has_companies for _, _, has_companies in loaded], index=df.index)
+    # unchanged films are reloaded only to retry a missing wikipedia link
+    # or to load their companies: the upsert leaves their row unchanged
+    to_refresh = (~(unchanged & has_link & has_companies)).to_numpy()
+    return df[to_refresh], ~has_link[to_refresh]
+
+
+def upsert_films(conn, df, batch_size=BATCH_SIZE):
+    """Merge films into the films table, keyed on the film id.
+    The films are loaded into a staging table, then:
+        - new films are inserted
+        - films with a different content hash are updated
+        - missing wikipedia links keep the value in the table
+    Note: the transaction is not committed
+    """
+    cur = conn.cursor()
+    cur.execute(sql_queries.films_staging_create)
+    cur.execute(sql_queries.films_staging_truncate)
+    bulk_insert(
+        conn,
+        df[sql_queries.films_table_columns],
+        sql_queries.films_staging_copy,
+        sql_queries.films_staging_insert_values,
+        batch_size=batch_size
+    )
+    cur.execute(sql_queries.films_table_upsert)
@@ -0,0 +1,57 @@
+import os
+import json
+import tempfile
+import unittest
+
+from etl_film_analytics.src.search_by_hash import search_documents_by_hash
+from etl_film_analytics.src.title_index import build_title_index
+from etl_film_analytics.benchmarks import run_benchmarks
+from etl_film_analytics.benchmarks.synthetic_data import write_wikipedia_xml, \
+    film_title, film_year
+
+
+class TestBenchmarks(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_synthetic_wikipedia(self):
+        """check that 3 films out of 4 have a document"""
+        wikipedia_filepath = os.path.join(self.directory, "wikipedia.xml")
+        write_wikipedia_xml(wikipedia_filepath, 1000, 400)
+        index = build_title_index(wikipedia_filepath)
+        documents = [(film_title(film_id), film_year(film_id))
+                     for film_id in range(1, 401)]
+        documents_features = search_documents_by_hash(
+            wikipedia_filepath, documents, index)
+        for film_id, (title, url, abstract) in enumerate(
+                documents_features, 1):
+            if film_id % 4 == 3:
+                self.assertIsNone(title)
+            else:
+                self.assertTrue(title.startswith(film_title(film_id)))
+                self.assertIsNotNone(abstract)
+
+    def test_run_benchmarks(self):
+        output = os.path.join(self.directory, "results.json")
+        run_benchmarks.main([
+            "--sizes", "200",
+            "--fixtures_dir", self.directory,
+            "--output", output,
+            "--repeat", "1",
+            "--queries", "10",
+            "--workers", "1"
+        ])
+        with open(output) as file:
+            report = json.load(file)
+        self.assertEqual(
+            set(run_benchmarks.SCENARIOS),
+            {result["scenario"] for result in report["results"]}
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.constants import REPOSITORY_PATH
+from etl_film_analytics.src.title_index import load_title_index
+from etl_film_analytics.__main__ import main
+
+
+class TestCli(unittest.TestCase):
+    def test_lazy_imports(self):
+        """check that the scripts do not load heavy dependencies at import"""
+        code = (
+            "import sys\n"
+            "import etl_film_analytics.__main__\n"
+            "import etl_film_analytics.scripts.etl\n"
+            "import etl_film_analytics.scripts.create_hash_table\n"
+            "import etl_film_analytics.scripts.create_tables\n"
+            "heavy = ['numpy', 'pandas', 'pyarrow', 'psycopg2', 'tabulate']\n"
+            "print(','.join(m for m in heavy if m in sys.modules))\n"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=REPOSITORY_PATH,
+            capture_output=True, text=True, check=True).stdout
+        self.assertEqual("", output.strip())
+
+    def test_build_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            table_filepath = os.path.join(directory, "index.idx")
+            main([
+                "build-index",
+                "--text_filepath={}".format(
+                    os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")),
+                "--table_filepath={}".format(table_filepath),
+                "--workers=1"
+            ])
+            self.assertEqual(28, len(load_title_index(table_filepath)))
+
+
+if __name__ == "__main__":
+    unittest.main()
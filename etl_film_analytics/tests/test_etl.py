@@ -25,6 +25,120 @@ class TestEtl(unittest.TestCase):
             )
         ])
 
+    def test_etl_scan(self):
+        etl.main([
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--database_uri={}".format(TEST_DB_URI),
+            "--lookup_mode=scan"
+        ])
+
+    def test_etl_pipeline(self):
+        etl.main([
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--database_uri={}".format(TEST_DB_URI),
+            "--table_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")
+            ),
+            "--chunk_size=3",
+            "--pipeline_depth=2"
+        ])
+
+    def test_etl_companies(self):
+        import psycopg2
+        etl.main([
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--database_uri={}".format(TEST_DB_URI),
+            "--table_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")
+            )
+        ])
+        conn = psycopg2.connect(TEST_DB_URI)
+        cur = conn.cursor()
+        # the names of each film are joined in the films table
+        cur.execute("""
+            select films.production_companies,
+                string_agg(companies.name, ',' order by position)
+            from films
+            join film_companies on film_companies.film_id = films.id
+            join companies on companies.id = film_companies.company_id
+            group by films.id
+        """)
+        for production_companies, names in cur.fetchall():
+            self.assertEqual(production_companies, names)
+        cur.execute("select count(*) from top_films_per_year")
+        self.assertGreater(cur.fetchone()[0], 0)
+        conn.close()
+
+    def test_etl_incremental(self):
+        args = [
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--database_uri={}".format(TEST_DB_URI),
+            "--table_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")
+            ),
+            "--incremental"
+        ]
+        # the second run finds every film already loaded
+        etl.main(args)
+        etl.main(args)
+
+    def test_etl_incremental_companies(self):
+        """check that an incremental run loads the companies of the films
+        loaded before the companies tables existed
+        """
+        import psycopg2
+        args = [
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--database_uri={}".format(TEST_DB_URI),
+            "--table_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")
+            )
+        ]
+        etl.main(args)
+        conn = psycopg2.connect(TEST_DB_URI)
+        cur = conn.cursor()
+        cur.execute("select count(*) from film_companies")
+        number_of_pairs = cur.fetchone()[0]
+        self.assertGreater(number_of_pairs, 0)
+        # a films table populated without the companies tables
+        cur.execute("drop table film_companies")
+        cur.execute("drop table companies")
+        conn.commit()
+        etl.main(args + ["--incremental"])
+        cur.execute("select count(*) from film_companies")
+        self.assertEqual(number_of_pairs, cur.fetchone()[0])
+        conn.close()
+
 
 class TestHashing(unittest.TestCase):
     def setUp(self):
@@ -41,7 +155,17 @@ class TestHashing(unittest.TestCase):
                 DIR_TEST_DATA, "wikipedia_test_set.xml")),
             "--table_filepath={}".format(
                 os.path.join(self.path_generated_test_files,
-                             "wikipedia_test_set.pickle"))
+                             "wikipedia_test_set.idx"))
+        ])
+
+    def test_create_hash_table_dict(self):
+        create_hash_table.main([
+            "--text_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set.xml")),
+            "--table_filepath={}".format(
+                os.path.join(self.path_generated_test_files,
+                             "wikipedia_test_set_dict.pickle")),
+            "--index_format=dict"
         ])
 
 
@@ -0,0 +1,112 @@
+import os
+import tempfile
+from collections import Counter
+import unittest
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.fuzzy_titles import normalize_title, \
+    score_candidate
+from etl_film_analytics.src.title_index import build_title_index, \
+    save_title_index, load_title_index
+from etl_film_analytics.src.sharded_index import save_sharded_title_index
+from etl_film_analytics.src.search_by_hash import search_documents_by_hash, \
+    has_fuzzy_index, get_fuzzy_document_features
+
+
+class TestFuzzyTitles(unittest.TestCase):
+    def setUp(self):
+        self.text_file = os.path.join(DIR_TEST_DATA,
+                                      "wikipedia_test_set.xml")
+        self.index = build_title_index(self.text_file, fuzzy=True)
+
+    def test_normalize_title(self):
+        for title in ["The Matrix", "Matrix, The", "the matrix!",
+                      "The Mátrix (1999 American film)"]:
+            self.assertEqual("matrix", normalize_title(title))
+        self.assertEqual("tom and jerry", normalize_title("Tom & Jerry"))
+        self.assertEqual("a", normalize_title("A"))
+
+    def test_score_candidate(self):
+        film = ("Heat (1995 film)", None, "Heat is a 1995 crime film.")
+        novel = ("Heat (novel)", None, "Heat is a novel published in 1995.")
+        self.assertGreater(score_candidate(film, "1995"),
+                           score_candidate(novel, "1995"))
+        self.assertEqual(0, score_candidate(film, "1972"))
+        self.assertEqual(0, score_candidate(novel, None))
+
+    def test_search_fuzzy(self):
+        documents = [
+            ("heat", 1995),
+            ("DEADFALL!", "1968"),
+            ("Déadfall", "1993"),
+            ("Heat", "2001"),
+            ("Jumanji", None)
+        ]
+        expected = [
+            "Heat (1995 film)",
+            "Deadfall (1968 film)",
+            "Deadfall (1993 film)",
+            None,
+            "Jumanji"
+        ]
+        for sort_by_position in [True, False]:
+            documents_features = search_documents_by_hash(
+                self.text_file, documents, self.index,
+                sort_by_position=sort_by_position)
+            self.assertEqual(
+                expected, [features[0] for features in documents_features])
+
+    def test_search_fuzzy_many_candidates(self):
+        """check that the film is found among many homonyms"""
+        # the candidates are read from the last to the first in the file
+        titles = ["Crash (2004 film)"] \
+            + [f"Crash ({number})" for number in range(40)]
+        with tempfile.TemporaryDirectory() as directory:
+            text_file = os.path.join(directory, "wikipedia.xml")
+            with open(text_file, "w") as file:
+                file.write("<root>\n")
+                for title in titles:
+                    file.write(
+                        f"<doc>\n<title>Wikipedia: {title}</title>\n"
+                        f"<url>https://en.wikipedia.org/wiki/{title}</url>\n"
+                        f"<abstract>{title}</abstract>\n</doc>\n")
+                file.write("</root>\n")
+            index = build_title_index(text_file, fuzzy=True)
+            documents_features = search_documents_by_hash(
+                text_file, [("CRASH", 2004)], index)
+            # the reads of a lookup are bounded
+            stats = Counter()
+            with open(text_file, "rb") as file:
+                features = get_fuzzy_document_features(
+                    file, ("CRASH", 2004), index, stats, max_candidates=8)
+        self.assertEqual("Crash (2004 film)", documents_features[0][0])
+        self.assertIsNone(features)
+        self.assertEqual({"fuzzy_truncated": 1, "fuzzy_miss": 1}, stats)
+
+    def test_has_fuzzy_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for fuzzy in [True, False]:
+                index = build_title_index(self.text_file, fuzzy=fuzzy)
+                index_filepath = os.path.join(directory, f"{fuzzy}.idx")
+                save_title_index(index, index_filepath)
+                self.assertEqual(fuzzy, has_fuzzy_index(index_filepath))
+                sharded_directory = os.path.join(directory, f"{fuzzy}")
+                save_sharded_title_index(index, sharded_directory, 2)
+                self.assertEqual(fuzzy, has_fuzzy_index(sharded_directory))
+        self.assertFalse(has_fuzzy_index(os.path.join(
+            DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")))
+
+    def test_build_fuzzy_index(self):
+        index = build_title_index(self.text_file, workers=3, fuzzy=True)
+        self.assertEqual(
+            self.index.fuzzy.keys.tolist(), index.fuzzy.keys.tolist())
+        with tempfile.TemporaryDirectory() as directory:
+            index_filepath = os.path.join(directory, "index.idx")
+            save_title_index(index, index_filepath)
+            loaded = load_title_index(index_filepath)
+            self.assertEqual(
+                index.fuzzy.offsets.tolist(), loaded.fuzzy.offsets.tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import gzip
+import shutil
+import unittest
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.gzip_dump import write_seekable_gzip, open_dump
+from etl_film_analytics.src.title_index import build_title_index, \
+    create_gzip_title_index
+from etl_film_analytics.src.search_by_hash import search_documents_by_hash
+
+
+class TestGzipDump(unittest.TestCase):
+    def setUp(self):
+        self.path_generated_test_files = os.path.join(
+            DIR_TEST_DATA, "generated")
+        os.makedirs(self.path_generated_test_files, exist_ok=True)
+        self.text_file = os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+        self.gzip_file = os.path.join(
+            self.path_generated_test_files, "wikipedia_test_set.xml.gz")
+        write_seekable_gzip(self.text_file, self.gzip_file, member_size=4096)
+        self.index = build_title_index(self.gzip_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.path_generated_test_files)
+
+    def test_seekable_gzip_is_gzip(self):
+        with open(self.text_file, 'rb') as file, \
+                gzip.open(self.gzip_file, 'rb') as gzip_file:
+            self.assertEqual(file.read(), gzip_file.read())
+
+    def test_offsets_match_plain_file(self):
+        index = build_title_index(self.text_file)
+        self.assertEqual(index.offsets.tolist(), self.index.offsets.tolist())
+        self.assertGreater(len(self.index.checkpoints), 1)
+
+    def test_single_member(self):
+        """check that a file without enough seek points is rejected"""
+        single_member_file = os.path.join(
+            self.path_generated_test_files, "single_member.xml.gz")
+        with open(self.text_file, 'rb') as file, \
+                gzip.open(single_member_file, 'wb') as gzip_file:
+            gzip_file.write(file.read())
+        with self.assertRaisesRegex(ValueError, "create_seekable_gzip"):
+            create_gzip_title_index(single_member_file, max_member_size=16384)
+        index = create_gzip_title_index(
+            self.gzip_file, max_member_size=16384)
+        self.assertEqual(self.index.keys.tolist(), index.keys.tolist())
+
+    def test_seek(self):
+        with open(self.text_file, 'rb') as file, \
+                open_dump(self.gzip_file, self.index.checkpoints,
+                          mode='rb') as gzip_file:
+            for position in [50000, 10, 20000, 20100, 0]:
+                file.seek(position)
+                gzip_file.seek(position)
+                self.assertEqual(file.read(5000), gzip_file.read(5000))
+
+    def test_search_documents(self):
+        documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968)
+        ]
+        self.assertEqual(
+            search_documents_by_hash(self.text_file, documents, self.index),
+            search_documents_by_hash(self.gzip_file, documents, self.index)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from etl_film_analytics.src.title_index import build_title_index, \
+    save_title_index
+from etl_film_analytics.src.sharded_index import save_sharded_title_index
+from etl_film_analytics.src.dump_fingerprint import dump_fingerprint
+from etl_film_analytics.src.incremental_index import find_segments, \
+    update_title_index, load_index_for_update
+from etl_film_analytics.src.search_by_hash import load_table
+from etl_film_analytics.benchmarks.synthetic_data import write_wikipedia_xml
+from etl_film_analytics.scripts import create_hash_table
+
+
+class TestIncrementalIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.text_file = os.path.join(self.directory, "wikipedia.xml")
+        write_wikipedia_xml(self.text_file, 10000, 5000)
+        self.index = build_title_index(self.text_file, fuzzy=True)
+        self.segments = find_segments(self.text_file)
+        # new version: a document moved earlier and an abstract edited
+        with open(self.text_file, 'rb') as file:
+            data = file.read()
+        first = data.index(b"<doc>", len(data) // 3)
+        second = data.index(b"<doc>", 2 * len(data) // 3)
+        moved = data[second:data.index(b"</doc>", second) + 7]
+        self.new_text_file = os.path.join(self.directory, "wikipedia_new.xml")
+        with open(self.new_text_file, 'wb') as file:
+            file.write(data[:first] + moved + data[first:second]
+                       + data[second:].replace(b"film", b"movie", 1))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameIndex(self, expected, index):
+        self.assertEqual(expected.keys.tolist(), index.keys.tolist())
+        self.assertEqual(expected.offsets.tolist(), index.offsets.tolist())
+        self.assertEqual(
+            expected.fuzzy.keys.tolist(), index.fuzzy.keys.tolist())
+        self.assertEqual(
+            expected.fuzzy.offsets.tolist(), index.fuzzy.offsets.tolist())
+
+    def test_segments_cover_the_file(self):
+        starts, ends, _ = self.segments
+        self.assertGreater(len(starts), 1)
+        self.assertEqual(0, starts[0])
+        self.assertEqual(os.path.getsize(self.text_file), ends[-1])
+        self.assertEqual(starts[1:].tolist(), ends[:-1].tolist())
+
+    def test_update_matches_full_build(self):
+        index, segments, reused = update_title_index(
+            self.new_text_file, self.index, self.segments, fuzzy=True)
+        self.assertSameIndex(
+            build_title_index(self.new_text_file, fuzzy=True), index)
+        self.assertEqual(
+            find_segments(self.new_text_file)[2].tolist(),
+            segments[2].tolist())
+        self.assertGreater(reused, 0)
+        self.assertLess(reused, len(segments[0]))
+
+    def test_update_stored_indexes(self):
+        table_filepath = os.path.join(self.directory, "index.idx")
+        save_title_index(self.index, table_filepath, segments=self.segments)
+        sharded_filepath = os.path.join(self.directory, "index")
+        save_sharded_title_index(
+            self.index, sharded_filepath, 3, segments=self.segments)
+        for filepath in [table_filepath, sharded_filepath]:
+            index, segments = load_index_for_update(filepath)
+            self.assertEqual(
+                self.segments[2].tolist(), segments[2].tolist())
+            index, _, _ = update_title_index(
+                self.new_text_file, index, segments, fuzzy=True)
+            self.assertSameIndex(
+                build_title_index(self.new_text_file, fuzzy=True), index)
+
+    def test_stale_table(self):
+        table_filepath = os.path.join(self.directory, "index.idx")
+        save_title_index(self.index, table_filepath,
+                         source=dump_fingerprint(self.text_file))
+        self.assertEqual(
+            len(self.index), len(load_table(table_filepath, self.text_file)))
+        with self.assertRaises(ValueError):
+            load_table(table_filepath, self.new_text_file)
+        # same content, e.g. a copy of the dataset
+        copy_filepath = os.path.join(self.directory, "copy.xml")
+        shutil.copy(self.text_file, copy_filepath)
+        load_table(table_filepath, copy_filepath)
+
+    def test_record_segments(self):
+        """check that the segments are recorded only on request"""
+        table_filepath = os.path.join(self.directory, "table.idx")
+        arguments = ["--text_filepath", self.text_file,
+                     "--table_filepath", table_filepath, "--workers=1"]
+        create_hash_table.main(arguments)
+        self.assertIsNone(load_index_for_update(table_filepath)[1])
+        create_hash_table.main(arguments + ["--segments"])
+        segments = load_index_for_update(table_filepath)[1]
+        self.assertEqual(self.segments[2].tolist(), segments[2].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import unittest
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.scripts.etl import WikipediaLookup, parse_input
+from etl_film_analytics.src.metrics import Metrics
+from etl_film_analytics.src.title_index import build_title_index, \
+    save_title_index
+from etl_film_analytics.src.dump_fingerprint import file_fingerprint
+from etl_film_analytics.src.lookup_cache import get_data_with_cache, \
+    LookupCache
+
+
+class TestLookupCache(unittest.TestCase):
+    def setUp(self):
+        self.path_generated_test_files = os.path.join(
+            DIR_TEST_DATA, "generated")
+        os.makedirs(self.path_generated_test_files, exist_ok=True)
+        self.cache_filepath = os.path.join(
+            self.path_generated_test_files, "cache.sqlite")
+        self.text_file = os.path.join(
+            self.path_generated_test_files, "wikipedia.xml")
+        shutil.copy(
+            os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml"),
+            self.text_file)
+        self.looked_up = []
+
+    def tearDown(self):
+        shutil.rmtree(self.path_generated_test_files)
+
+    def lookup(self, documents):
+        self.looked_up += list(documents)
+        links = [f"link {title}" if year else None
+                 for title, year in documents]
+        return links, [None] * len(documents)
+
+    def get_data(self, documents):
+        cache = LookupCache(
+            self.cache_filepath, file_fingerprint(self.text_file))
+        data = get_data_with_cache(cache, documents, self.lookup)
+        cache.close()
+        return data
+
+    def test_cache(self):
+        documents = [("Heat", 1995), ("Toy Story", None)]
+        expected = (["link Heat", None], [None, None])
+        self.assertEqual(expected, self.get_data(documents))
+        # cached, including the document without a match
+        self.assertEqual(
+            expected, self.get_data([("Heat", "1995"), ("Toy Story", "")]))
+        self.assertEqual(2, len(self.looked_up))
+        # a new version of the dataset evicts the cache
+        with open(self.text_file, 'a') as file:
+            file.write("\n")
+        self.get_data(documents)
+        self.assertEqual(4, len(self.looked_up))
+
+    def test_cache_fingerprint(self):
+        """check that the misses of a table without normalized titles
+        are not reused by a table with them
+        """
+        fingerprints = []
+        for fuzzy in [False, True]:
+            table_filepath = os.path.join(
+                self.path_generated_test_files, f"table-{fuzzy}.idx")
+            save_title_index(
+                build_title_index(self.text_file, fuzzy=fuzzy),
+                table_filepath)
+            lookup = WikipediaLookup(parse_input([
+                "--wikipedia_filepath", self.text_file,
+                "--table_filepath", table_filepath,
+                "--cache_filepath", self.cache_filepath
+            ]), Metrics())
+            get_data_with_cache(lookup.cache, [("Missing", None)],
+                                self.lookup)
+            fingerprints.append(lookup.cache.fingerprint)
+            lookup.close()
+        self.assertNotEqual(fingerprints[0], fingerprints[1])
+        self.assertEqual(2, len(self.looked_up))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import json
+import tempfile
+import unittest
+from collections import Counter
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.metrics import Metrics, record_lookup
+from etl_film_analytics.src.search_by_hash import generate_queries, \
+    search_documents_by_hash, load_table
+from etl_film_analytics.src.search_by_scan import search_documents_by_scan
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.text_file = os.path.join(DIR_TEST_DATA,
+                                      "wikipedia_test_set.xml")
+        self.table = load_table(os.path.join(
+            DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle"))
+        self.documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968),
+            ("Jumanji", 1995),
+            ("Missing film", None)
+        ]
+
+    def test_record_lookup(self):
+        stats = Counter()
+        queries = generate_queries(("Heat", 1995))
+        record_lookup(stats, queries, queries[1])
+        record_lookup(stats, generate_queries(("Heat", None)), None)
+        self.assertEqual(
+            {"year_film_miss": 1, "film_hit": 1,
+             "film_miss": 1, "title_miss": 1},
+            dict(stats)
+        )
+
+    def test_search_stats(self):
+        """check that every search path counts the same lookups"""
+        expected = Counter()
+        search_documents_by_hash(self.text_file, self.documents, self.table,
+                                 sort_by_position=False, stats=expected)
+        self.assertEqual(len(self.documents), sum(
+            count for key, count in expected.items() if key.endswith("_hit")
+        ) + expected["title_miss"])
+        for kwargs in [{"sort_by_position": True}, {"workers": 3}]:
+            stats = Counter()
+            search_documents_by_hash(self.text_file, self.documents,
+                                     self.table, stats=stats, **kwargs)
+            self.assertEqual(expected, stats)
+        stats = Counter()
+        search_documents_by_scan(self.text_file, self.documents, stats)
+        self.assertEqual(expected, stats)
+
+    def test_report(self):
+        metrics = Metrics()
+        chunks = list(metrics.iterate("chunks", [[1, 2], [3]]))
+        with metrics.stage("sum") as stage:
+            stage["rows"] += len(chunks)
+        with tempfile.TemporaryDirectory() as directory:
+            report_filepath = os.path.join(directory, "metrics.json")
+            metrics.save(report_filepath)
+            with open(report_filepath) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(2, report["stages"]["chunks"]["calls"])
+        self.assertEqual(3, report["stages"]["chunks"]["rows"])
+        self.assertEqual(2, report["stages"]["sum"]["rows"])
+
+    def test_stage_memory(self):
+        """check that the stage allocating memory raises the peak"""
+        metrics = Metrics()
+        with metrics.stage("small"):
+            pass
+        with metrics.stage("large"):
+            large = b"\x01" * (64 << 20)
+        del large
+        stages = metrics.report()["stages"]
+        if stages["large"]["peak_rss"] is None:
+            self.skipTest("peak resident memory is not available")
+        self.assertGreaterEqual(
+            stages["large"]["peak_rss"], stages["small"]["peak_rss"])
+        self.assertGreaterEqual(
+            stages["large"]["peak_rss_increase"], 32 << 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import pyarrow.dataset as ds
+
+from etl_film_analytics.scripts import etl
+from etl_film_analytics.src import sql_queries
+from etl_film_analytics.src.processing_csv import process_metadata
+from etl_film_analytics.src.parquet_export import ParquetSink, read_films, \
+    FILMS_SCHEMA
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+
+
+class TestParquetExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.parquet_dir = os.path.join(self.directory, "films")
+        self.df_films = process_metadata(
+            os.path.join(DIR_TEST_DATA, "metadata_small.csv"))
+        self.df_films["wikipedia_page_link"] = None
+        self.df_films["wikipedia_abstract"] = "abstract"
+        self.df_films["content_hash"] = None
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_schema_of_films_table(self):
+        self.assertEqual(sql_queries.films_table_columns, FILMS_SCHEMA.names)
+
+    def test_write_partitioned_dataset(self):
+        sink = ParquetSink(self.parquet_dir, rows_per_write=3)
+        sink.write(self.df_films.iloc[:4])
+        sink.write(self.df_films.iloc[4:])
+        sink.commit()
+        self.assertEqual(
+            sorted(f"release_year={year}"
+                   for year in set(self.df_films["release_year"])),
+            sorted(os.listdir(self.parquet_dir)))
+        df = read_films(self.parquet_dir)
+        self.assertEqual(sorted(self.df_films["id"].tolist()),
+                         sorted(df["id"].tolist()))
+        self.assertEqual("int32", str(df["release_year"].dtype))
+        df = read_films(self.parquet_dir, columns=["id", "ratio"],
+                        filter=ds.field("release_year") == 1995)
+        self.assertEqual(["id", "ratio"], list(df.columns))
+        self.assertEqual(
+            sorted(self.df_films[self.df_films["release_year"] == "1995"]
+                   ["id"].tolist()),
+            sorted(df["id"].tolist()))
+
+    def test_abort_keeps_previous_dataset(self):
+        sink = ParquetSink(self.parquet_dir)
+        sink.write(self.df_films)
+        sink.commit()
+        sink = ParquetSink(self.parquet_dir, rows_per_write=1)
+        sink.write(self.df_films.iloc[:2])
+        sink.abort()
+        self.assertEqual(len(self.df_films), len(read_films(self.parquet_dir)))
+        self.assertEqual(["films"], os.listdir(self.directory))
+
+    def test_etl_parquet_sink(self):
+        etl.main([
+            "--metadata_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "metadata_small.csv")
+            ),
+            "--wikipedia_filepath={}".format(
+                os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+            ),
+            "--number_of_elements=10",
+            "--table_filepath={}".format(os.path.join(
+                DIR_TEST_DATA, "wikipedia_test_set_hashtable.pickle")
+            ),
+            "--sinks", "parquet",
+            "--parquet_dir={}".format(self.parquet_dir)
+        ])
+        df = read_films(self.parquet_dir)
+        self.assertEqual(sorted(self.df_films["id"].tolist()),
+                         sorted(df["id"].tolist()))
+        self.assertTrue(df["wikipedia_page_link"].notna().any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import time
+import threading
+import unittest
+
+import pandas as pd
+
+from etl_film_analytics.scripts.etl import enrich_chunk, enrich_chunks
+from etl_film_analytics.src.utils_tables import compute_content_hash
+from etl_film_analytics.src.pipeline import iter_in_background
+
+
+class StandInLookup:
+    """Wikipedia lookup without a dataset, every film is found"""
+
+    def __init__(self):
+        self.looked_up = []
+
+    def get_data_from_wikipedia(self, df_metadata):
+        self.looked_up += df_metadata["id"].tolist()
+        return ["link"] * len(df_metadata), ["abstract"] * len(df_metadata)
+
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.produced = []
+        self.closed = threading.Event()
+
+    def produce(self, number_of_elements, failure_at=None):
+        try:
+            for element in range(number_of_elements):
+                if element == failure_at:
+                    raise RuntimeError("producer failure")
+                self.produced.append(element)
+                yield element
+        finally:
+            self.closed.set()
+
+    def test_order(self):
+        elements = iter_in_background(self.produce(100), maxsize=3)
+        self.assertEqual(list(range(100)), list(elements))
+        self.assertTrue(self.closed.is_set())
+
+    def test_chained_stages(self):
+        squares = iter_in_background(
+            (element ** 2 for element in
+             iter_in_background(self.produce(20), maxsize=2)),
+            maxsize=2)
+        self.assertEqual([element ** 2 for element in range(20)],
+                         list(squares))
+
+    def test_close_chained_stages(self):
+        """check that an early close stops every background stage"""
+        chunks = (pd.DataFrame({
+            "id": [element], "title": ["Heat"], "budget": [1],
+            "release_year": ["1995"], "revenue": [2], "vote_average": [7.7],
+            "ratio": [0.5], "production_companies": [""]
+        }) for element in self.produce(1000))
+        # the first stage stays referenced, as in `etl.run`
+        chunks = iter_in_background(chunks, name="process_metadata")
+        enriched_chunks = iter_in_background(
+            enrich_chunks(chunks, StandInLookup(), None),
+            name="enrich_chunks")
+        self.assertEqual("link", next(enriched_chunks)[
+            "wikipedia_page_link"].iloc[0])
+        enriched_chunks.close()
+        self.assertEqual([], [
+            thread.name for thread in threading.enumerate()
+            if thread.name in ("process_metadata", "enrich_chunks")])
+        self.assertLess(len(self.produced), 1000)
+
+    def test_enrich_chunk_repeated_labels(self):
+        """check that only the films that need it are looked up
+        when the labels of a chunk repeat
+        """
+        df = pd.DataFrame({
+            "id": [1, 2, 3], "title": ["Heat", "Toy Story", "Jumanji"],
+            "budget": [1, 1, 1], "release_year": ["1995"] * 3,
+            "revenue": [2, 2, 2], "vote_average": [7.7] * 3,
+            "ratio": [0.5] * 3, "production_companies": [""] * 3
+        }, index=[0, 0, 0])
+        content_hash = compute_content_hash(df)
+        loaded_films = {
+            # reloaded for its companies, it keeps its link
+            1: (content_hash[0], True, False),
+            # reloaded to retry the link
+            2: (content_hash[1], False, True),
+            # complete
+            3: (content_hash[2], True, True)
+        }
+        lookup = StandInLookup()
+        df_films = enrich_chunk(df, lookup, loaded_films)
+        self.assertEqual([2], lookup.looked_up)
+        self.assertEqual([1, 2], df_films["id"].tolist())
+        self.assertEqual([None, "link"],
+                         df_films["wikipedia_page_link"].tolist())
+
+    def test_back_pressure(self):
+        elements = iter_in_background(self.produce(100), maxsize=2)
+        self.assertEqual(0, next(elements))
+        time.sleep(0.2)
+        # one element consumed, two queued, one waiting to be queued
+        self.assertLessEqual(len(self.produced), 4)
+        elements.close()
+
+    def test_producer_failure(self):
+        elements = iter_in_background(self.produce(10, failure_at=5))
+        consumed = []
+        with self.assertRaises(RuntimeError):
+            for element in elements:
+                consumed.append(element)
+        self.assertEqual(list(range(5)), consumed)
+
+    def test_consumer_failure(self):
+        elements = iter_in_background(self.produce(1000), maxsize=2)
+        for element in elements:
+            if element == 3:
+                break
+        elements.close()
+        self.assertTrue(self.closed.is_set())
+        self.assertLess(len(self.produced), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,35 @@
 import os
+import ast
+import csv
+import tempfile
 import unittest
 
-from etl_film_analytics.src.processing_csv import process_metadata
+import pandas as pd
+
+from etl_film_analytics.src.processing_csv import process_metadata, \
+    iter_processed_metadata, decode_list_of_dictionaries, decode_names, \
+    aggregate_data_sources, compute_ratio, get_metadata, \
+    LIST_OF_DICTIONARIES_COLUMNS, METADATA_COLUMN_NAMES, COLUMNS_OF_INTEREST
 from etl_film_analytics.tests.constants import DIR_TEST_DATA
 
 
+def aggregate_with_merge(film_metadata, budget_to_revenue_ratio):
+    """Reference aggregation, with a dataframe of all the metadata columns"""
+    df_metadata = pd.DataFrame(film_metadata, columns=METADATA_COLUMN_NAMES)
+    df_ratio = pd.DataFrame(budget_to_revenue_ratio, columns=["id", "ratio"])
+    df_metadata["id"] = df_metadata["id"].astype(int)
+    df_metadata["release_year"] = \
+        df_metadata["release_date"].str.split("-").str[0]
+    df_metadata["company_names"] = df_metadata[
+        "production_companies"].apply(decode_names)
+    df_metadata["production_companies"] = df_metadata[
+        "production_companies"].apply(decode_list_of_dictionaries)
+    df_processed = pd.merge(df_metadata, df_ratio, on="id")
+    df_processed = df_processed[COLUMNS_OF_INTEREST]
+    df_processed = df_processed.sort_values(by="ratio", ascending=False)
+    return df_processed.drop_duplicates(subset="id")
+
+
 class TestProcessingCsv(unittest.TestCase):
 
     def setUp(self):
@@ -14,3 +39,97 @@ class TestProcessingCsv(unittest.TestCase):
         """check the top scorer in the test set"""
         df = process_metadata(self.path_csv, number_of_elements=3)
         self.assertEqual(df.iloc[0, :]["title"], "Heat")
+
+    def test_process_metadata_engines(self):
+        """check that the columnar and the row by row engines agree"""
+        for number_of_elements in [None, 3]:
+            pd.testing.assert_frame_equal(
+                process_metadata(self.path_csv, number_of_elements,
+                                 engine="csv"),
+                process_metadata(self.path_csv, number_of_elements,
+                                 engine="arrow")
+            )
+
+    def test_iter_processed_metadata(self):
+        """check that the chunks contain the top scorers in order"""
+        df = process_metadata(self.path_csv, number_of_elements=5)
+        chunks = list(iter_processed_metadata(
+            self.path_csv, number_of_elements=5, chunk_size=2))
+        self.assertEqual([2, 2, 1], [len(chunk) for chunk in chunks])
+        df_chunks = pd.concat(chunks)
+        self.assertEqual(df["id"].tolist(), df_chunks["id"].tolist())
+        self.assertEqual(df["ratio"].tolist(), df_chunks["ratio"].tolist())
+
+    def test_iter_processed_metadata_blocks(self):
+        """check that the rows of a file read in several blocks
+        have distinct labels
+        """
+        for number_of_elements in [None, 5]:
+            chunks = list(iter_processed_metadata(
+                self.path_csv, number_of_elements, chunk_size=3))
+            small_block_chunks = list(iter_processed_metadata(
+                self.path_csv, number_of_elements, chunk_size=3,
+                block_size=2048))
+            df = pd.concat(small_block_chunks)
+            self.assertTrue(df.index.is_unique)
+            pd.testing.assert_frame_equal(pd.concat(chunks), df)
+
+    def test_iter_processed_metadata_duplicates(self):
+        """check that duplicated top scorers do not reduce the selection"""
+        with open(self.path_csv, newline='') as csvfile:
+            rows = list(csv.reader(csvfile))
+        df = process_metadata(self.path_csv, number_of_elements=2)
+        top_row = next(row for row in rows
+                       if row[METADATA_COLUMN_NAMES.index("id")]
+                       == str(df["id"].iloc[0]))
+        with tempfile.TemporaryDirectory() as directory:
+            path_csv = os.path.join(directory, "metadata.csv")
+            with open(path_csv, "w", newline='') as csvfile:
+                csv.writer(csvfile).writerows(rows + [top_row, top_row])
+            chunks = list(iter_processed_metadata(
+                path_csv, number_of_elements=3, chunk_size=2))
+            # selection of the etl: all the distinct films, then the top 3
+            df = process_metadata(path_csv).iloc[:3]
+        df_chunks = pd.concat(chunks)
+        self.assertEqual(3, df_chunks["id"].nunique())
+        self.assertEqual(df["id"].tolist(), df_chunks["id"].tolist())
+
+    def test_aggregate_data_sources(self):
+        """check the aggregation against a merge of all the columns"""
+        budget_to_revenue_ratio = compute_ratio(self.path_csv)
+        film_metadata = get_metadata(
+            self.path_csv, [film_id for film_id, _ in budget_to_revenue_ratio])
+        # duplicated films and ratio, ratio without a film
+        film_metadata = film_metadata[::-1] + film_metadata[:3]
+        budget_to_revenue_ratio = budget_to_revenue_ratio \
+            + budget_to_revenue_ratio[1:4] + [(-1, 0.5)]
+        # the labels of duplicated films depend on the row order
+        # of the merge, which changed in pandas 2.2: only the rows are compared
+        pd.testing.assert_frame_equal(
+            aggregate_with_merge(
+                film_metadata, budget_to_revenue_ratio
+            ).reset_index(drop=True),
+            aggregate_data_sources(
+                film_metadata, budget_to_revenue_ratio
+            ).reset_index(drop=True)
+        )
+
+    def test_decode_list_of_dictionaries(self):
+        """check the decoder against a python literal parser"""
+        with open(self.path_csv, newline='') as csvfile:
+            encoded_lists = [row[column]
+                             for row in csv.DictReader(csvfile)
+                             for column in LIST_OF_DICTIONARIES_COLUMNS]
+        encoded_lists += [
+            "[]",
+            """[{'id': 1, 'name': "Children's Films"}]""",
+            """[{'name': 'Quote \\' and "double"', 'id': 2}]""",
+            """[{'name': 'Brace {', 'id': 3}, {'name': '', 'id': 4}]""",
+            """[{'name': 'Comma, Inc.', 'id': 5}, {'name': 'Pixar'}]"""
+        ]
+        for encoded_list in encoded_lists:
+            expected = [elem["name"]
+                        for elem in ast.literal_eval(encoded_list)]
+            self.assertEqual(expected, decode_names(encoded_list))
+            self.assertEqual(
+                ",".join(expected), decode_list_of_dictionaries(encoded_list))
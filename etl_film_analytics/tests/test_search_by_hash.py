@@ -1,10 +1,29 @@
+import io
 import unittest
 import pickle
 import os
 
 from etl_film_analytics.tests.constants import DIR_TEST_DATA
 from etl_film_analytics.src.search_by_hash import read_document, \
-    get_document_features, get_documents_features
+    parse_document, generate_queries, get_document_features, \
+    get_documents_features, get_documents_features_batched, \
+    read_documents_sorted, DOCUMENT_HEAD_SIZE
+
+
+class CountingReader(io.BytesIO):
+    """In-memory file that counts the bytes read"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def fileno(self):
+        raise io.UnsupportedOperation("in-memory file")
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
 
 
 class TestHashSearch(unittest.TestCase):
@@ -14,17 +33,45 @@ class TestHashSearch(unittest.TestCase):
         table_filepath = os.path.join(DIR_TEST_DATA,
                                       "wikipedia_test_set_hashtable.pickle")
         self.file = open(text_file, 'r')
+        self.binary_file = open(text_file, 'rb')
         with open(table_filepath, 'rb') as table_file:
             self.table = pickle.load(table_file)
 
     def tearDown(self):
         self.file.close()
+        self.binary_file.close()
 
     def test_read_document(self):
         query = "<title>Wikipedia: Heat (1995 film)</title>"
         document_position = self.table[query]
         title, url, abstract = read_document(self.file, document_position)
         self.assertEqual('https://en.wikipedia.org/wiki/Heat_(1995_film)', url)
+        self.assertEqual(
+            (title, url, abstract),
+            read_document(self.binary_file, document_position)
+        )
+
+    def test_parse_document(self):
+        """check the entities and the abstracts on several lines"""
+        document = (
+            b"    <title>Wikipedia: Tom &amp; Jerry</title>\n"
+            b"    <url>https://en.wikipedia.org/wiki/Tom_and_Jerry</url>\n"
+            b"    <abstract>A cat &lt;Tom&gt; &amp;amp; a mouse   \n"
+            b"    on &#34;two&#34; lines</abstract>\n"
+            b"    <links>\n"
+        )
+        self.assertEqual(
+            ("Tom & Jerry",
+             "https://en.wikipedia.org/wiki/Tom_and_Jerry",
+             'A cat <Tom> &amp; a mouse on "two" lines'),
+            parse_document(document)
+        )
+        self.assertEqual(
+            ("Heat", None, None),
+            parse_document(b"<title>Wikipedia: Heat</title>\n<links>\n")
+        )
+        self.assertIn("<title>Wikipedia: Tom &amp; Jerry</title>",
+                      generate_queries(("Tom & Jerry", None)))
 
     def test_search_document(self):
         document = ("Heat", 1995)
@@ -41,6 +88,38 @@ class TestHashSearch(unittest.TestCase):
             self.file, documents, self.table)
         self.assertTrue('Heat (1995 film)', documents_features[0][0])
 
+    def test_search_documents_batched(self):
+        documents = [
+            ("Toy Story", None),
+            ("Heat", 1995),
+            ("Missing film", 2000),
+            ("Deadfall", 1968),
+            ("Heat", 1995),
+        ]
+        self.assertEqual(
+            [list(features) for features in get_documents_features(
+                self.file, documents, self.table)],
+            [list(features) for features in get_documents_features_batched(
+                self.binary_file, documents, self.table, chunk_size=1024)]
+        )
+
+    def test_read_documents_sorted_sparse(self):
+        """check that far documents are read alone, close ones together"""
+        document = b"<title>Wikipedia: Heat</title>\n<abstract>Heat</abstract>" \
+                   b"\n</doc>\n"
+        padding = b" " * (1 << 20)
+        data = padding.join([document] * 4) + document * 3
+        positions = [i * (len(document) + len(padding)) for i in range(4)] \
+            + [3 * (len(document) + len(padding)) + i * len(document)
+               for i in range(1, 4)]
+        file = CountingReader(data)
+        documents = read_documents_sorted(file, positions)
+        self.assertEqual(positions, list(documents))
+        self.assertEqual(
+            {("Heat", None, "Heat")},
+            set(features for _, features in documents.values()))
+        self.assertLess(file.bytes_read, 4 * DOCUMENT_HEAD_SIZE)
+
 
 if __name__ == "__main__":
     unittest.main()
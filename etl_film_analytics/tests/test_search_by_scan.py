@@ -0,0 +1,38 @@
+import unittest
+import pickle
+import os
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.search_by_hash import get_documents_features
+from etl_film_analytics.src.search_by_scan import search_documents_by_scan
+
+
+class TestScanSearch(unittest.TestCase):
+    def setUp(self):
+        self.text_file = os.path.join(DIR_TEST_DATA,
+                                      "wikipedia_test_set.xml")
+        table_filepath = os.path.join(DIR_TEST_DATA,
+                                      "wikipedia_test_set_hashtable.pickle")
+        with open(table_filepath, 'rb') as table_file:
+            self.table = pickle.load(table_file)
+
+    def test_search_documents(self):
+        documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968),
+            ("Jumanji", 1995),
+            ("Missing film", None)
+        ]
+        with open(self.text_file, 'r') as file:
+            expected_features = get_documents_features(
+                file, documents, self.table)
+        self.assertEqual(
+            [list(features) for features in expected_features],
+            [list(features) for features in search_documents_by_scan(
+                self.text_file, documents)]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import tempfile
+import os
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.gzip_dump import write_seekable_gzip
+from etl_film_analytics.src.title_index import build_title_index
+from etl_film_analytics.src.sharded_index import save_sharded_title_index, \
+    load_sharded_title_index
+from etl_film_analytics.src.search_by_hash import search_documents_by_hash, \
+    load_table
+
+
+class TestShardedIndex(unittest.TestCase):
+    def setUp(self):
+        self.text_file = os.path.join(DIR_TEST_DATA, "wikipedia_test_set.xml")
+        self.index = build_title_index(self.text_file, fuzzy=True)
+        self.directory = tempfile.TemporaryDirectory()
+        self.table_filepath = os.path.join(self.directory.name, "index")
+        save_sharded_title_index(self.index, self.table_filepath, 4)
+        self.documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968),
+            ("Jumanji", 1995),
+            ("the matrix", 1999),
+            ("Missing film", None)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_shards_partition_the_index(self):
+        index = load_table(self.table_filepath)
+        self.assertEqual(len(self.index), len(index))
+        self.assertEqual({}, index.opened_shards)
+        keys = sorted(key for shard in range(4)
+                      for key in index.open_shard(shard).keys.tolist())
+        self.assertEqual(self.index.keys.tolist(), keys)
+
+    def test_search_documents(self):
+        index = load_table(self.table_filepath)
+        for workers in [1, 3]:
+            self.assertEqual(
+                search_documents_by_hash(
+                    self.text_file, self.documents, self.index),
+                search_documents_by_hash(
+                    self.text_file, self.documents, index, workers=workers)
+            )
+
+    def test_lookup_opens_only_its_shard(self):
+        index = load_table(self.table_filepath)
+        query = "<title>Wikipedia: Heat (1995 film)</title>"
+        with open(self.text_file, 'r') as file:
+            self.assertEqual(
+                self.index.get(query, file), index.get(query, file))
+        self.assertEqual([index.shard_of(query)], list(index.opened_shards))
+
+    def test_subset_of_shards(self):
+        query = "<title>Wikipedia: Heat (1995 film)</title>"
+        index = load_sharded_title_index(self.table_filepath, shards=[0])
+        shard = index.shard_of(query)
+        if shard != 0:
+            with self.assertRaises(KeyError):
+                index.candidates(query)
+        index = load_sharded_title_index(self.table_filepath, shards=[shard])
+        self.assertEqual(self.index.candidates(query), index.candidates(query))
+
+    def test_gzip_checkpoints(self):
+        gzip_file = os.path.join(self.directory.name, "wikipedia.xml.gz")
+        write_seekable_gzip(self.text_file, gzip_file, member_size=4096)
+        gzip_index = build_title_index(gzip_file)
+        table_filepath = os.path.join(self.directory.name, "gzip_index")
+        save_sharded_title_index(gzip_index, table_filepath, 3)
+        index = load_table(table_filepath)
+        self.assertEqual(
+            gzip_index.checkpoints.tolist(), index.checkpoints.tolist())
+        self.assertEqual(
+            search_documents_by_hash(gzip_file, self.documents, gzip_index),
+            search_documents_by_hash(gzip_file, self.documents, index)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import tempfile
+import pickle
+import os
+
+from etl_film_analytics.tests.constants import DIR_TEST_DATA
+from etl_film_analytics.src.title_index import create_title_index, \
+    save_title_index, build_title_index, split_file
+from etl_film_analytics.src.search_by_hash import get_documents_features, \
+    get_documents_features_batched, search_documents_by_hash, load_table
+
+
+class TestTitleIndex(unittest.TestCase):
+    def setUp(self):
+        text_file = os.path.join(DIR_TEST_DATA,
+                                 "wikipedia_test_set.xml")
+        table_filepath = os.path.join(DIR_TEST_DATA,
+                                      "wikipedia_test_set_hashtable.pickle")
+        self.text_file = text_file
+        self.file = open(text_file, 'r')
+        with open(table_filepath, 'rb') as table_file:
+            self.table = pickle.load(table_file)
+        with open(text_file, 'rb') as binary_file:
+            self.index = create_title_index(binary_file)
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_index_contains_only_titles(self):
+        titles = [line for line in self.table if line.startswith("<title>")]
+        self.assertEqual(len(titles), len(self.index))
+
+    def test_get_matches_hash_table(self):
+        for line, position in self.table.items():
+            if line.startswith("<title>"):
+                self.assertEqual(position, self.index.get(line, self.file))
+
+    def test_get_missing_title(self):
+        query = "<title>Wikipedia: Heat (1968 film)</title>"
+        self.assertIsNone(self.index.get(query, self.file))
+
+    def test_search_documents(self):
+        documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968)
+        ]
+        self.assertEqual(
+            get_documents_features(self.file, documents, self.table),
+            get_documents_features(self.file, documents, self.index)
+        )
+        with open(self.text_file, 'rb') as binary_file:
+            self.assertEqual(
+                get_documents_features(self.file, documents, self.index),
+                get_documents_features_batched(
+                    binary_file, documents, self.index)
+            )
+
+    def test_search_documents_workers(self):
+        documents = [
+            ("Heat", 1995),
+            ("Toy Story", None),
+            ("Deadfall", 1968),
+            ("Jumanji", 1995),
+            ("Missing film", None)
+        ]
+        for sort_by_position in [True, False]:
+            self.assertEqual(
+                search_documents_by_hash(
+                    self.text_file, documents, self.index,
+                    sort_by_position=sort_by_position),
+                search_documents_by_hash(
+                    self.text_file, documents, self.index,
+                    sort_by_position=sort_by_position, workers=3)
+            )
+
+    def test_split_file(self):
+        ranges = split_file(self.text_file, 8)
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(os.path.getsize(self.text_file), ranges[-1][1])
+        for start, _ in ranges[1:]:
+            self.file.seek(start)
+            self.assertEqual("<doc>", self.file.readline().strip())
+
+    def test_build_title_index(self):
+        for workers in [1, 3]:
+            index = build_title_index(self.text_file, workers=workers)
+            self.assertEqual(self.index.keys.tolist(), index.keys.tolist())
+            self.assertEqual(
+                self.index.offsets.tolist(), index.offsets.tolist())
+
+    def test_memory_mapped_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            index_filepath = os.path.join(directory, "index.idx")
+            save_title_index(self.index, index_filepath)
+            index = load_table(index_filepath)
+            self.assertEqual(self.index.keys.tolist(), index.keys.tolist())
+            self.assertEqual(
+                self.index.offsets.tolist(), index.offsets.tolist())
+            query = "<title>Wikipedia: Heat (1995 film)</title>"
+            self.assertEqual(
+                self.index.get(query, self.file), index.get(query, self.file))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from etl_film_analytics.src.utils_tables import format_copy_rows, \
+    compute_content_hash, select_films_to_refresh, explode_companies, \
+    load_film_companies
+from etl_film_analytics.benchmarks.database_stand_in import StandInConnection
+
+
+class TestUtilsTables(unittest.TestCase):
+    def test_format_copy_rows(self):
+        df = pd.DataFrame({
+            "id": [1, 2],
+            "title": ["Heat", "Tab\tand\\backslash\nnewline"],
+            "ratio": [0.5, np.nan],
+            "wikipedia_page_link": [None, ""]
+        })
+        self.assertEqual(
+            "1\tHeat\t0.5\t\\N\n"
+            "2\tTab\\tand\\\\backslash\\nnewline\t\\N\t\n",
+            format_copy_rows(df).getvalue()
+        )
+
+    def test_select_films_to_refresh(self):
+        df = pd.DataFrame({
+            "id": [1, 2, 3, 4],
+            "title": ["Heat", "Toy Story", "Jumanji", "Deadfall"],
+            "budget": [60000000, 30000000, 65000000, 10000000],
+            "release_year": [1995, 1995, 1995, 1993],
+            "revenue": [187436818, 373554033, 262797249, 18],
+            "vote_average": [7.7, 7.7, 6.9, 3.1],
+            "ratio": [0.32, 0.08, 0.25, 555555.6],
+            "production_companies": ["Regency", "Pixar", "TriStar", ""]
+        })
+        df["content_hash"] = compute_content_hash(df)
+        # columns outside of the content do not change the hash
+        self.assertEqual(
+            df["content_hash"].tolist(),
+            compute_content_hash(df.assign(wikipedia_page_link="link")))
+        loaded_films = {
+            # unchanged, with a link
+            1: (df["content_hash"][0], True, True),
+            # unchanged, without a link
+            2: (df["content_hash"][1], False, True),
+            # changed, with a link
+            3: ("outdated", True, True),
+        }
+        df_to_refresh, needs_lookup = select_films_to_refresh(
+            df, loaded_films)
+        self.assertEqual([2, 3, 4], df_to_refresh["id"].tolist())
+        self.assertEqual([True, False, True], needs_lookup.tolist())
+        # unchanged, with a link, loaded before the companies tables
+        loaded_films[1] = (df["content_hash"][0], True, False)
+        df_to_refresh, needs_lookup = select_films_to_refresh(
+            df, loaded_films)
+        self.assertEqual([1, 2, 3, 4], df_to_refresh["id"].tolist())
+        self.assertEqual([False, True, False, True], needs_lookup.tolist())
+
+    def test_explode_companies(self):
+        df = pd.DataFrame({
+            "id": [1, 2, 3],
+            "company_names": [["Regency", "Comma, Inc."], [], ["Pixar"]]
+        })
+        self.assertEqual(
+            [(1, 0, "Regency"), (1, 1, "Comma, Inc."), (3, 0, "Pixar")],
+            list(explode_companies(df).itertuples(index=False, name=None)))
+        conn = StandInConnection()
+        load_film_companies(conn, df)
+        self.assertEqual(
+            len(format_copy_rows(explode_companies(df)).getvalue()),
+            conn.bytes_sent)
+
+
+if __name__ == "__main__":
+    unittest.main()